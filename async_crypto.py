@@ -0,0 +1,76 @@
+"""
+asyncio API for decrypting crypt streams inside an event loop.
+
+    async for chunk in decrypt_stream(reader, data_key):
+        await response.write(chunk)
+
+Block opens run on a thread pool in batches of `read_size`, so the event
+loop never blocks on libsodium. All streams share one bounded pool unless
+they bring their own executor.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import crypto
+
+# Worker threads shared by every stream that doesn't pass its own executor.
+DEFAULT_WORKERS = min(32, os.cpu_count() or 1)
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+def get_executor():
+    """The pool shared by all streams, created on first use."""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS,
+                                                  thread_name_prefix="redexter-decrypt")
+        return _shared_executor
+
+async def _read_chunks(reader, read_size):
+    # asyncio/aiohttp StreamReaders are read `read_size` at a time; anything
+    # else must be an async iterable of byte chunks.
+    if hasattr(reader, "read"):
+        while True:
+            data = await reader.read(read_size)
+            if not data:
+                return
+            yield data
+    else:
+        async for data in reader:
+            yield data
+
+async def decrypt_stream(reader, data_key, read_size=crypto.DEFAULT_READ_SIZE, executor=None):
+    """
+    Decrypt a crypt stream from `reader` and yield plaintext chunks.
+
+    Each chunk read is decrypted on `executor` (the shared pool by default)
+    while the next one is being read. Nothing more is read until the
+    consumer has taken the previous output, so a slow consumer slows down
+    the reader instead of filling memory.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or get_executor()
+    decryptor = crypto.StreamDecryptor(data_key, read_size)
+    job = None
+    async for data in _read_chunks(reader, read_size):
+        if job is not None:
+            for chunk in await job:
+                yield chunk
+        job = loop.run_in_executor(executor, decryptor.feed, data)
+    if job is not None:
+        for chunk in await job:
+            yield chunk
+    for chunk in await loop.run_in_executor(executor, decryptor.finish):
+        yield chunk
+
+async def decrypt_file(input_file, data_key, dest_dir=None, executor=None, **decrypt_options):
+    """Run crypto.decrypt_file on the executor. Returns 0 on success and 1 on failure."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or get_executor(),
+        lambda: crypto.decrypt_file(input_file, data_key, dest_dir, **decrypt_options),
+    )
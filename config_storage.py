@@ -6,6 +6,10 @@ import keyring
 CONFIG_CACHE_FILE = os.path.expanduser("~/.redexter_config.json")
 # Service name for keyring storage.
 KEYRING_SERVICE = "ReDexter_rclone_config"
+# Keyring entry holding derived key material, as JSON mapping key digest -> key (hex).
+DERIVED_KEYS_ENTRY = "derived_keys"
+# Derived keys kept in the keyring; the oldest are dropped first.
+MAX_STORED_KEYS = 8
 
 def get_last_config_path():
     if os.path.exists(CONFIG_CACHE_FILE):
@@ -33,10 +37,40 @@ def set_config_password(config_path, password):
     """Store the config password in the OS keyring for the given config file."""
     keyring.set_password(KEYRING_SERVICE, config_path, password)
 
+def _load_derived_keys():
+    stored = keyring.get_password(KEYRING_SERVICE, DERIVED_KEYS_ENTRY)
+    if not stored:
+        return {}
+    try:
+        return json.loads(stored)
+    except ValueError:
+        return {}
+
+def get_derived_key(digest):
+    """Retrieve derived key material from the OS keyring, or None."""
+    key = _load_derived_keys().get(digest)
+    return bytes.fromhex(key) if key else None
+
+def set_derived_key(digest, key):
+    """Store derived key material in the OS keyring under its digest."""
+    keys = _load_derived_keys()
+    keys.pop(digest, None)
+    keys[digest] = key.hex()
+    while len(keys) > MAX_STORED_KEYS:
+        del keys[next(iter(keys))]
+    keyring.set_password(KEYRING_SERVICE, DERIVED_KEYS_ENTRY, json.dumps(keys))
+
+def clear_derived_keys():
+    """Remove all derived key material from the OS keyring."""
+    try:
+        keyring.delete_password(KEYRING_SERVICE, DERIVED_KEYS_ENTRY)
+    except keyring.errors.PasswordDeleteError:
+        pass
+
 def clear_config_full():
     """
-    Clears the saved config path and removes the associated keyring password.
-    This helps ensure that sensitive data is not retained.
+    Clears the saved config path and removes the associated keyring password
+    and any derived keys stored in the keyring. This helps ensure that sensitive data is not retained.
     """
     config_path = get_last_config_path()
     if config_path:
@@ -44,6 +78,10 @@ def clear_config_full():
             keyring.delete_password(KEYRING_SERVICE, config_path)
         except Exception as e:
             print("Error deleting keyring password:", e)
+    try:
+        clear_derived_keys()
+    except Exception as e:
+        print("Error deleting stored keys:", e)
     if os.path.exists(CONFIG_CACHE_FILE):
         try:
             os.remove(CONFIG_CACHE_FILE)
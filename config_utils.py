@@ -1,21 +1,80 @@
 import configparser
+import hashlib
 import os
+import shutil
 import subprocess
+import threading
+import time
+import unicodedata
 
-from PyQt6.QtWidgets import QInputDialog, QLineEdit
+# First line of a config encrypted with `rclone config encryption set`.
+CONFIG_ENCRYPTION_HEADER = "RCLONE_ENCRYPT_V0:"
+# A cached config is only trusted on inode, size and mtime alone when the file
+# was last modified this many seconds before the entry was checked; more recent
+# writes may not have moved the mtime, so those files are hashed again.
+CONFIG_MTIME_SLACK = 2.0
 
-def load_rclone_config(file_path, config_password=None):
+class ConfigPasswordError(ValueError):
+    """Raised when an encrypted config has no password or the wrong one."""
+
+def config_key(config_password):
+    """The secretbox key rclone derives from a config password."""
+    password = unicodedata.normalize("NFKC", config_password.strip())
+    return hashlib.sha256(f"[{password}][rclone-config]".encode("utf-8")).digest()
+
+def _encrypted_payload(config_text):
     """
-    Uses rclone API (via subprocess call to "rclone config show") to get the decrypted config.
-    If config_password is provided, it is used; otherwise the user is prompted.
+    Returns the base64 payload of an encrypted config, or None for a plain one.
+    Like rclone, blank and comment lines before the header are skipped.
     """
-    if config_password is None:
-        pwd, ok = QInputDialog.getText(None, "Config Password",
-                                       "Enter rclone config password (leave blank if none):",
-                                       QLineEdit.EchoMode.Password)
-        if not ok:
-            raise ValueError("No config password provided.")
-        config_password = pwd.strip()
+    lines = config_text.splitlines()
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith((";", "#")):
+            continue
+        if line == CONFIG_ENCRYPTION_HEADER:
+            return "".join(lines[i + 1:])
+        if line.startswith("RCLONE_ENCRYPT_V"):
+            raise ValueError("Unsupported config encryption version: " + line)
+        return None
+    return None
+
+def is_config_encrypted(config_text):
+    try:
+        return _encrypted_payload(config_text) is not None
+    except ValueError:
+        return True
+
+def decrypt_config_text(config_text, config_password):
+    """Decrypt the text of an rclone config. Plain configs are returned unchanged."""
+    import base64
+    import binascii
+    import nacl.secret
+    import nacl.exceptions
+    payload = _encrypted_payload(config_text)
+    if payload is None:
+        return config_text
+    if not config_password:
+        raise ConfigPasswordError("Config is encrypted and no password was given.")
+    try:
+        box = base64.b64decode("".join(payload.split()), validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Failed to decode encrypted config: {e}")
+    if len(box) < nacl.secret.SecretBox.NONCE_SIZE + nacl.secret.SecretBox.MACBYTES:
+        raise ValueError("Encrypted config is too short.")
+    try:
+        plain = nacl.secret.SecretBox(config_key(config_password)).decrypt(box)
+    except nacl.exceptions.CryptoError:
+        raise ConfigPasswordError("Wrong config password.")
+    return plain.decode("utf-8")
+
+def read_rclone_config(file_path, config_password=""):
+    """Read and decrypt an rclone config file in-process, without rclone."""
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        config_text = f.read()
+    return parse_config(decrypt_config_text(config_text, config_password))
+
+def _rclone_config_show(file_path, config_password):
     env = os.environ.copy()
     if config_password:
         env["RCLONE_CONFIG_PASS"] = config_password
@@ -25,6 +84,99 @@ def load_rclone_config(file_path, config_password=None):
         raise ValueError("rclone config show failed: " + result.stderr)
     return parse_config(result.stdout)
 
+def _config_from_text(file_path, config_text, config_password):
+    try:
+        return parse_config(decrypt_config_text(config_text, config_password))
+    except ConfigPasswordError:
+        raise
+    except (ValueError, configparser.Error) as e:
+        if shutil.which("rclone") is None:
+            raise
+        print("Reading config natively failed, trying rclone:", e)
+        return _rclone_config_show(file_path, config_password)
+
+def load_rclone_config(file_path, config_password=None):
+    """
+    Read an rclone config, decrypting it natively if it is encrypted.
+    If config_password is None and the config is encrypted, the user is prompted.
+    Falls back to "rclone config show" when the file can't be handled here
+    (e.g. a newer encryption format) and an rclone binary is available.
+    """
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        config_text = f.read()
+    if config_password is None:
+        config_password = ""
+        if is_config_encrypted(config_text):
+            # Only the GUI prompts; headless callers always pass a password.
+            from PyQt6.QtWidgets import QInputDialog, QLineEdit
+            pwd, ok = QInputDialog.getText(None, "Config Password",
+                                           "Enter rclone config password (leave blank if none):",
+                                           QLineEdit.EchoMode.Password)
+            if not ok:
+                raise ValueError("No config password provided.")
+            config_password = pwd.strip()
+    return _config_from_text(file_path, config_text, config_password)
+
+class _CachedConfig:
+    __slots__ = ("stat_key", "checked_at", "content_digest", "password_digest", "config", "remotes")
+
+    def matches(self, password_digest):
+        # Plain configs don't depend on the password they were loaded with.
+        return self.password_digest is None or self.password_digest == password_digest
+
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+def _password_digest(config_password):
+    return hashlib.blake2b(config_password.encode("utf-8"), digest_size=16,
+                           person=b"redexter-conf").digest()
+
+def load_crypt_remotes(file_path, config_password=""):
+    """
+    Load a config and its crypt remotes (see get_crypt_remotes), cached per file.
+    Returns (config, crypt_remotes); the config is shared and must not be modified.
+
+    An entry is reused while the file's inode, size and mtime are unchanged.
+    If those changed, or the mtime is too recent to be trusted, the contents
+    are hashed, and the file is only parsed again if the hash differs.
+    Entries for encrypted configs are also tied to the config password.
+    The cache lives in memory for the life of the process; nothing is written
+    to disk, since entries hold revealed crypt passwords.
+    """
+    path = os.path.abspath(file_path)
+    st = os.stat(path)
+    stat_key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    password_digest = _password_digest(config_password or "")
+    with _config_cache_lock:
+        entry = _config_cache.get(path)
+    if (entry is not None and entry.matches(password_digest) and entry.stat_key == stat_key
+            and entry.checked_at - st.st_mtime > CONFIG_MTIME_SLACK):
+        return entry.config, dict(entry.remotes)
+    with open(path, "rb") as f:
+        data = f.read()
+    content_digest = hashlib.blake2b(data).digest()
+    if entry is not None and entry.matches(password_digest) and entry.content_digest == content_digest:
+        entry.stat_key = stat_key
+        entry.checked_at = time.time()
+        return entry.config, dict(entry.remotes)
+
+    config_text = data.decode("utf-8-sig")
+    entry = _CachedConfig()
+    entry.config = _config_from_text(path, config_text, config_password or "")
+    entry.remotes = get_crypt_remotes(entry.config)
+    entry.stat_key = stat_key
+    entry.checked_at = time.time()
+    entry.content_digest = content_digest
+    entry.password_digest = password_digest if is_config_encrypted(config_text) else None
+    with _config_cache_lock:
+        _config_cache[path] = entry
+    return entry.config, dict(entry.remotes)
+
+def clear_config_cache():
+    """Drop all cached configs, including the crypt passwords revealed from them."""
+    with _config_cache_lock:
+        _config_cache.clear()
+
 def parse_config(config_text):
     config = configparser.ConfigParser()
     config.read_string(config_text)
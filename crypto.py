@@ -1,11 +1,25 @@
 import os
+import mmap
+import stat
+import errno
 import base64
-import hashlib
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 
 import nacl.secret
-import nacl.pwhash
+import nacl.exceptions
+import nacl.bindings
+try:
+    # PyNaCl's cffi module is private; without it blocks go through the
+    # public (slower, copying) nacl.bindings API instead.
+    from nacl._sodium import ffi, lib
+except ImportError:
+    ffi = lib = None
 from Crypto.Cipher import AES
 
+from journal import Journal, JOURNAL_INTERVAL
+
 # --- Constants for file decryption (rclone crypt file format) ---
 FILE_MAGIC = b'RCLONE\x00\x00'
 FILE_MAGIC_SIZE = 8
@@ -13,6 +27,39 @@ FILE_NONCE_SIZE = 24
 BLOCK_HEADER_SIZE = nacl.secret.SecretBox.MACBYTES
 BLOCK_DATA_SIZE = 64 * 1024
 BLOCK_SIZE = BLOCK_HEADER_SIZE + BLOCK_DATA_SIZE
+FILE_HEADER_SIZE = FILE_MAGIC_SIZE + FILE_NONCE_SIZE
+
+# --- Bulk I/O ---
+# Default amount of ciphertext fetched per read syscall. Reads are rounded up
+# to whole blocks, and the matching plaintext is written with one write call.
+DEFAULT_READ_SIZE = 4 * 1024 * 1024
+
+# --- Page-cache policies (the io_policy argument) ---
+# Leave caching to the kernel.
+IO_POLICY_DEFAULT = "default"
+# Sequential access and aggressive read-ahead on the input.
+IO_POLICY_SEQUENTIAL = "sequential"
+# As sequential, and drop already processed input and output pages from the cache.
+IO_POLICY_NOCACHE = "nocache"
+# As nocache, but write the output with O_DIRECT where the filesystem allows it.
+IO_POLICY_DIRECT = "direct"
+IO_POLICIES = (IO_POLICY_DEFAULT, IO_POLICY_SEQUENTIAL, IO_POLICY_NOCACHE, IO_POLICY_DIRECT)
+# Input read ahead of the current position with POSIX_FADV_WILLNEED.
+READAHEAD_WINDOW = 32 * 1024 * 1024
+# Written output is flushed and dropped from the cache every this many bytes.
+CACHE_DROP_INTERVAL = 64 * 1024 * 1024
+# Buffer, offset and length alignment used for O_DIRECT writes.
+DIRECT_IO_ALIGNMENT = 4096
+
+# --- Memory-mapped input ---
+# Regular files at least this large are decrypted straight from an mmap.
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# --- Parallel decryption tuning ---
+# Smallest block range handed to a worker (16 blocks = 1 MiB of plaintext).
+PARALLEL_MIN_BLOCKS = 16
+# Ranges created per worker, so faster workers can pick up the slack.
+PARALLEL_RANGES_PER_WORKER = 4
 
 # --- Default salt (rclone crypt default) ---
 DEFAULT_SALT = bytes([
@@ -28,6 +75,44 @@ CRYPT_KEY = bytes([
     0xf4, 0xde, 0x16, 0x2b, 0x8b, 0x95, 0xf6, 0x38,
 ])
 
+class DecryptionCancelled(Exception):
+    """Raised when a decryption is stopped through its `cancel` event."""
+
+class _StopEvent(threading.Event):
+    """An Event that also counts as set once `parent` (another Event, or None) is."""
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self._parent = parent
+
+    def is_set(self):
+        return super().is_set() or (self._parent is not None and self._parent.is_set())
+
+def check_cancelled(cancel):
+    """Raise DecryptionCancelled if the threading.Event `cancel` is set."""
+    if cancel is not None and cancel.is_set():
+        raise DecryptionCancelled("Decryption cancelled.")
+
+def remove_partial(output_file):
+    """Delete an output that was only partly written. Missing files are fine."""
+    try:
+        os.remove(output_file)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print("Could not remove partial output:", e)
+
+@contextlib.contextmanager
+def _removed_on_error(output_file, keep=False):
+    # Remove `output_file` if the block raises, unless `keep`. A preallocated
+    # output already has its final size, so a failed one could pass for complete.
+    try:
+        yield
+    except BaseException:
+        if not keep:
+            remove_partial(output_file)
+        raise
+
 def reveal(obscured_value):
     """
     Reverse rclone’s obscure function.
@@ -51,87 +136,841 @@ def reveal(obscured_value):
     except UnicodeDecodeError:
         return plain.hex()
 
-def decode_salt(salt_input):
+def salt_bytes(salt=None):
     """
-    Convert salt_input to exactly 32 bytes.
-    If salt_input is 16 bytes (or decodes to 16), it is doubled.
-    Otherwise, SHA-256 is used.
+    The salt as rclone uses it: the raw bytes of the remote's salt (password2),
+    or the default salt when none is set.
     """
-    REQUIRED_SALT_LENGTH = 32
-    if isinstance(salt_input, bytes):
-        salt_bytes = salt_input
-    elif isinstance(salt_input, str):
-        try:
-            salt_bytes = bytes.fromhex(salt_input)
-        except ValueError:
-            try:
-                salt_bytes = base64.b64decode(salt_input)
-            except Exception:
-                salt_bytes = salt_input.encode('utf-8')
-    else:
-        raise ValueError("Salt must be provided as bytes or a string.")
-    if len(salt_bytes) == REQUIRED_SALT_LENGTH:
-        return salt_bytes
-    elif len(salt_bytes) == REQUIRED_SALT_LENGTH // 2:
-        return salt_bytes * 2
-    else:
-        return hashlib.sha256(salt_bytes).digest()
+    if salt is None or salt == "" or salt == b"":
+        return DEFAULT_SALT
+    if isinstance(salt, bytes):
+        return salt
+    if isinstance(salt, str):
+        return salt.encode('utf-8')
+    raise ValueError("Salt must be provided as bytes or a string.")
 
-def make_key(password, salt=None, min_password_length=8):
+# --- Key derivation (scrypt parameters and key layout used by rclone) ---
+SCRYPT_N = 16384
+SCRYPT_R = 8
+SCRYPT_P = 1
+DATA_KEY_SIZE = nacl.secret.SecretBox.KEY_SIZE
+NAME_KEY_SIZE = 32
+NAME_TWEAK_SIZE = 16
+KEY_MATERIAL_SIZE = DATA_KEY_SIZE + NAME_KEY_SIZE + NAME_TWEAK_SIZE
+# Everything besides the password and salt that determines the derived key.
+# Cached keys are looked up under these too, so changing them invalidates the cache.
+KDF_PARAMS = ("scrypt", SCRYPT_N, SCRYPT_R, SCRYPT_P, KEY_MATERIAL_SIZE)
+
+def make_key_material(password, salt=None, min_password_length=8):
     """
-    Derive a 32-byte key using scrypt from a user-supplied password and salt.
+    Derive rclone's 80 bytes of key material from the crypt password and salt:
+    the data key, the name key and the name tweak, in that order
+    (see split_key_material).
     """
     if len(password) < min_password_length:
         raise ValueError(f"Password must be at least {min_password_length} characters long.")
-    if salt is None:
-        salt = DEFAULT_SALT
-    salt = decode_salt(salt)
-    key = nacl.pwhash.scrypt.kdf(
-        nacl.secret.SecretBox.KEY_SIZE,
-        password.encode('utf-8'),
-        salt,
-        opslimit=nacl.pwhash.scrypt.OPSLIMIT_INTERACTIVE,
-        memlimit=nacl.pwhash.scrypt.MEMLIMIT_INTERACTIVE
-    )
-    return key
-
-def decrypt_file(input_file, data_key, dest_dir=None):
-    # Determine output file name: if dest_dir is provided, use that folder.
+    return nacl.bindings.crypto_pwhash_scryptsalsa208sha256_ll(
+        password.encode('utf-8'), salt_bytes(salt),
+        SCRYPT_N, SCRYPT_R, SCRYPT_P, KEY_MATERIAL_SIZE, maxmem=64 * 1024 * 1024)
+
+def split_key_material(key_material):
+    """Returns (data_key, name_key, name_tweak)."""
+    if len(key_material) != KEY_MATERIAL_SIZE:
+        raise ValueError(f"Key material must be {KEY_MATERIAL_SIZE} bytes long.")
+    name_start = DATA_KEY_SIZE
+    tweak_start = DATA_KEY_SIZE + NAME_KEY_SIZE
+    return (bytes(key_material[:name_start]), bytes(key_material[name_start:tweak_start]),
+            bytes(key_material[tweak_start:]))
+
+def make_key(password, salt=None, min_password_length=8):
+    """
+    Derive the 32-byte data key from a crypt password and salt.
+    See keycache.derive_key for a cached version.
+    """
+    return make_key_material(password, salt, min_password_length)[:DATA_KEY_SIZE]
+
+class BlockDecryptor:
+    """
+    Opens the data blocks of a single rclone crypt file.
+    One cipher context is kept per file: the key and the running nonce live in
+    C buffers, and the nonce is advanced in place after every block. Without
+    PyNaCl's cffi module they are plain bytes and nacl.bindings is used.
+    """
+
+    def __init__(self, data_key, nonce):
+        if len(data_key) != nacl.secret.SecretBox.KEY_SIZE:
+            raise ValueError(f"Data key must be {nacl.secret.SecretBox.KEY_SIZE} bytes long.")
+        if len(nonce) != FILE_NONCE_SIZE:
+            raise ValueError(f"Nonce must be {FILE_NONCE_SIZE} bytes long.")
+        if ffi is None:
+            self._key = bytes(data_key)
+            self._nonce = bytes(nonce)
+        else:
+            self._key = ffi.new("unsigned char[]", bytes(data_key))
+            self._nonce = ffi.new("unsigned char[]", bytes(nonce))
+
+    def seek(self, header_nonce, block_index):
+        """Position the nonce at `block_index`, given the nonce from the file header."""
+        nonce = nonce_add(header_nonce, block_index)
+        if ffi is None:
+            self._nonce = nonce
+        else:
+            ffi.memmove(self._nonce, nonce, FILE_NONCE_SIZE)
+
+    @property
+    def nonce(self):
+        """The nonce that will be used for the next block."""
+        if ffi is None:
+            return self._nonce
+        return bytes(ffi.buffer(self._nonce, FILE_NONCE_SIZE))
+
+    def open_block(self, cipher_block, out):
+        """
+        Authenticate and decrypt one block into the writable buffer `out`.
+        Returns the number of plaintext bytes written; raises CryptoError on a bad MAC.
+        """
+        cipher_len = len(cipher_block)
+        plain_len = cipher_len - BLOCK_HEADER_SIZE
+        if plain_len <= 0:
+            raise ValueError("Block too short to contain data.")
+        if len(out) < plain_len:
+            raise ValueError("Output buffer too small for block.")
+        if ffi is None:
+            plain = nacl.bindings.crypto_secretbox_open(bytes(cipher_block), self._nonce, self._key)
+            out[:plain_len] = plain
+            self._nonce = increment_nonce(self._nonce)
+            return plain_len
+        rc = lib.crypto_secretbox_open_easy(
+            ffi.from_buffer(out, require_writable=True),
+            ffi.from_buffer(cipher_block),
+            cipher_len,
+            self._nonce,
+            self._key,
+        )
+        if rc != 0:
+            raise nacl.exceptions.CryptoError("Decryption failed. Ciphertext failed verification")
+        lib.sodium_increment(self._nonce, FILE_NONCE_SIZE)
+        return plain_len
+
+    def open_blocks(self, cipher_data, out, first_block=0):
+        """
+        Decrypt a run of consecutive blocks from `cipher_data` into `out`.
+        Only the last block may be short. `first_block` is only used in error messages.
+        Returns the total number of plaintext bytes written.
+        """
+        plain_len = 0
+        with memoryview(cipher_data) as cipher_view, memoryview(out) as out_view:
+            for i, offset in enumerate(range(0, len(cipher_view), BLOCK_SIZE)):
+                with cipher_view[offset:offset + BLOCK_SIZE] as block:
+                    if len(block) <= BLOCK_HEADER_SIZE:
+                        raise ValueError(f"Corrupted block {first_block + i}: too short to contain data.")
+                    # Released right away, so an error can't leave the buffer exported.
+                    with out_view[plain_len:plain_len + BLOCK_DATA_SIZE] as out_block:
+                        plain_len += self.open_block(block, out_block)
+        return plain_len
+
+def readinto_full(infile, buf):
+    """
+    Fill `buf` from `infile`, retrying on short reads.
+    Returns the number of bytes read, which is only short at end of file.
+    """
+    view = memoryview(buf)
+    total = 0
+    while total < len(view):
+        n = infile.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+def blocks_per_read(read_size):
+    """Whole blocks fetched per read for a requested `read_size` in bytes (at least one)."""
+    return max(1, -(-int(read_size) // BLOCK_SIZE))
+
+def block_count(cipher_size):
+    """Number of data blocks in a crypt file of `cipher_size` bytes."""
+    payload = cipher_size - FILE_HEADER_SIZE
+    if payload < 0:
+        raise ValueError("File too short to contain a header.")
+    return (payload + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+def plaintext_size(cipher_size):
+    """
+    Exact size of the decrypted data for a crypt file of `cipher_size` bytes:
+    the header and one MAC per block are removed.
+    """
+    payload = cipher_size - FILE_HEADER_SIZE
+    if payload < 0:
+        raise ValueError("File too short to contain a header.")
+    full_blocks, tail = divmod(payload, BLOCK_SIZE)
+    if 0 < tail <= BLOCK_HEADER_SIZE:
+        raise ValueError(f"Corrupted block {full_blocks}: too short to contain data.")
+    return full_blocks * BLOCK_DATA_SIZE + max(tail - BLOCK_HEADER_SIZE, 0)
+
+def split_block_ranges(num_blocks, parts, min_blocks=PARALLEL_MIN_BLOCKS):
+    """Split block indices [0, num_blocks) into at most `parts` contiguous (start, stop) ranges."""
+    if num_blocks <= 0:
+        return []
+    parts = max(1, min(parts, (num_blocks + min_blocks - 1) // min_blocks))
+    step, extra = divmod(num_blocks, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        stop = start + step + (1 if part < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def output_path_for(input_file, dest_dir=None):
+    """Output path for `input_file`: its name without extension, in `dest_dir` if given."""
     base_name = os.path.splitext(os.path.basename(input_file))[0]
     if dest_dir:
-        os.makedirs(dest_dir, exist_ok=True)
-        output_file = os.path.join(dest_dir, base_name)
+        return os.path.join(dest_dir, base_name)
+    return os.path.splitext(input_file)[0]
+
+def read_header(infile):
+    """Validate the magic of an open crypt file and return its 24-byte header nonce."""
+    magic = infile.read(FILE_MAGIC_SIZE)
+    if magic != FILE_MAGIC:
+        raise ValueError("Invalid file header.")
+    nonce = infile.read(FILE_NONCE_SIZE)
+    if len(nonce) != FILE_NONCE_SIZE:
+        raise ValueError("Failed to read nonce.")
+    return nonce
+
+def preallocate_output(fd, size):
+    """
+    Reserve `size` bytes for the output file so it is laid out contiguously.
+    Uses posix_fallocate where the platform and filesystem support it, and
+    otherwise just sets the file length. Raises OSError(ENOSPC) when the
+    space is not available.
+    """
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+                raise
+    os.ftruncate(fd, size)
+
+def pwrite_full(fd, data, offset):
+    """Write all of `data` at `offset`, retrying on short writes."""
+    with memoryview(data) as view:
+        while view:
+            n = os.pwrite(fd, view, offset)
+            view = view[n:]
+            offset += n
+
+class CacheHints:
+    """
+    Applies an io_policy to one input/output file pair: read-ahead hints for
+    the input and, for the nocache policies, dropping pages that have already
+    been processed. Output pages are dirty until written back, so they are
+    flushed with fdatasync every CACHE_DROP_INTERVAL bytes before being dropped.
+    """
+
+    def __init__(self, policy, in_fd=None, out_fd=None):
+        if policy not in IO_POLICIES:
+            raise ValueError(f"Unknown I/O policy: {policy}")
+        available = hasattr(os, "posix_fadvise")
+        # Hints only mean something for regular files; pipes reject them.
+        if in_fd is not None and not stat.S_ISREG(os.fstat(in_fd).st_mode):
+            in_fd = None
+        self.in_fd = in_fd
+        self.out_fd = out_fd
+        self.readahead = available and policy != IO_POLICY_DEFAULT
+        self.drop = available and policy in (IO_POLICY_NOCACHE, IO_POLICY_DIRECT)
+        self._dirty_start = None
+        self._dirty_end = 0
+        if self.readahead and in_fd is not None:
+            os.posix_fadvise(in_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def input_done(self, offset, length):
+        """`length` bytes of input at `offset` have been consumed."""
+        if self.in_fd is None:
+            return
+        if self.readahead:
+            os.posix_fadvise(self.in_fd, offset + length, READAHEAD_WINDOW, os.POSIX_FADV_WILLNEED)
+        if self.drop:
+            os.posix_fadvise(self.in_fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+    def output_done(self, offset, length):
+        """`length` bytes of output at `offset` have been written."""
+        if not self.drop or self.out_fd is None:
+            return
+        if self._dirty_start is None:
+            self._dirty_start = offset
+        self._dirty_start = min(self._dirty_start, offset)
+        self._dirty_end = max(self._dirty_end, offset + length)
+        if self._dirty_end - self._dirty_start >= CACHE_DROP_INTERVAL:
+            self.finish()
+
+    def finish(self):
+        """Flush and drop whatever output is still cached."""
+        if self._dirty_start is None:
+            return
+        os.fdatasync(self.out_fd)
+        os.posix_fadvise(self.out_fd, self._dirty_start, self._dirty_end - self._dirty_start,
+                         os.POSIX_FADV_DONTNEED)
+        self._dirty_start = None
+        self._dirty_end = 0
+
+def enable_direct_output(fd):
+    """Switch `fd` to O_DIRECT. Returns False if the platform or filesystem doesn't allow it."""
+    if not hasattr(os, "O_DIRECT"):
+        return False
+    import fcntl
+    try:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_DIRECT)
+    except OSError:
+        return False
+    return True
+
+def _plain_buffer(size, direct):
+    # O_DIRECT needs aligned memory; anonymous maps are page-aligned.
+    return mmap.mmap(-1, size) if direct else bytearray(size)
+
+def _aligned_length(length):
+    return -(-length // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+
+def _pread_into(fd, view, offset):
+    # Fill `view` from `offset`, retrying short reads; returns the bytes read.
+    total = 0
+    while total < len(view):
+        if hasattr(os, "preadv"):
+            n = os.preadv(fd, [view[total:]], offset + total)
+        else:
+            os.lseek(fd, offset + total, os.SEEK_SET)
+            data = os.read(fd, len(view) - total)
+            n = len(data)
+            view[total:total + n] = data
+        if not n:
+            break
+        total += n
+    return total
+
+def decrypt_block_range(in_fd, out_fd, data_key, header_nonce, start, stop,
+                        read_size=DEFAULT_READ_SIZE, io_policy=IO_POLICY_DEFAULT, direct=False,
+                        on_bytes=None, cancel=None):
+    """
+    Decrypt blocks [start, stop) using positional reads and writes on raw file
+    descriptors. Each chunk of blocks is read from its ciphertext offset and its
+    plaintext written to its own offset, so ranges can run concurrently on the
+    same files. With `direct` (out_fd already in O_DIRECT mode) a short final
+    chunk is padded to the alignment; the caller truncates the file afterwards.
+    `on_bytes(count)` is called with the plaintext size of every chunk written.
+    `cancel` is a threading.Event checked before every chunk (see decrypt_to).
+    """
+    chunk_blocks = blocks_per_read(read_size)
+    hints = CacheHints(io_policy, in_fd, out_fd)
+    decryptor = BlockDecryptor(data_key, header_nonce)
+    decryptor.seek(header_nonce, start)
+    cipher_buf = bytearray(min(chunk_blocks, stop - start) * BLOCK_SIZE)
+    plain_buf = _plain_buffer(min(chunk_blocks, stop - start) * BLOCK_DATA_SIZE, direct)
+    try:
+        with memoryview(cipher_buf) as cipher_view, memoryview(plain_buf) as plain_view:
+            for first in range(start, stop, chunk_blocks):
+                check_cancelled(cancel)
+                count = min(chunk_blocks, stop - first)
+                in_offset = FILE_HEADER_SIZE + first * BLOCK_SIZE
+                n = _pread_into(in_fd, cipher_view[:count * BLOCK_SIZE], in_offset)
+                if n <= (count - 1) * BLOCK_SIZE:
+                    raise ValueError(f"Corrupted block {first + n // BLOCK_SIZE}: file is truncated.")
+                hints.input_done(in_offset, n)
+                plain_len = decryptor.open_blocks(cipher_view[:n], plain_view, first)
+                write_len = _aligned_length(plain_len) if direct else plain_len
+                pwrite_full(out_fd, plain_view[:write_len], first * BLOCK_DATA_SIZE)
+                hints.output_done(first * BLOCK_DATA_SIZE, plain_len)
+                if on_bytes:
+                    on_bytes(plain_len)
+        hints.finish()
+    finally:
+        if direct:
+            plain_buf.close()
+
+def verify_block_range(in_fd, data_key, header_nonce, start, stop, read_size=DEFAULT_READ_SIZE,
+                       io_policy=IO_POLICY_DEFAULT, on_bytes=None, cancel=None):
+    """
+    Authenticate blocks [start, stop) without writing anything: every block's
+    Poly1305 tag is checked and the plaintext is thrown away. Reads are
+    positional, so ranges of one file can be checked concurrently.
+    Returns the index of the first block in the range that fails (a block too
+    short to hold any data counts as failed), or None if they all pass.
+    `on_bytes` and `cancel` are as for decrypt_block_range.
+    """
+    chunk_blocks = blocks_per_read(read_size)
+    hints = CacheHints(io_policy, in_fd)
+    decryptor = BlockDecryptor(data_key, header_nonce)
+    decryptor.seek(header_nonce, start)
+    cipher_buf = bytearray(min(chunk_blocks, stop - start) * BLOCK_SIZE)
+    scratch = bytearray(BLOCK_DATA_SIZE)
+    with memoryview(cipher_buf) as cipher_view:
+        for first in range(start, stop, chunk_blocks):
+            check_cancelled(cancel)
+            count = min(chunk_blocks, stop - first)
+            in_offset = FILE_HEADER_SIZE + first * BLOCK_SIZE
+            n = _pread_into(in_fd, cipher_view[:count * BLOCK_SIZE], in_offset)
+            hints.input_done(in_offset, n)
+            plain_len = 0
+            for i in range(count):
+                offset = i * BLOCK_SIZE
+                if n - offset <= BLOCK_HEADER_SIZE:
+                    return first + i
+                with cipher_view[offset:min(offset + BLOCK_SIZE, n)] as block:
+                    try:
+                        plain_len += decryptor.open_block(block, scratch)
+                    except nacl.exceptions.CryptoError:
+                        return first + i
+            if on_bytes:
+                on_bytes(plain_len)
+    return None
+
+def verify_file(input_file, data_key, workers=1, read_size=DEFAULT_READ_SIZE,
+                io_policy=IO_POLICY_DEFAULT, on_bytes=None, cancel=None):
+    """
+    Check that every block of an rclone crypt file authenticates under
+    `data_key`, without writing any output. Returns None if the file is
+    intact, or the index of the first bad block. Raises ValueError for a
+    file without a valid header.
+    With `workers` > 1 the blocks are split into ranges checked on a thread
+    pool. `on_bytes(count)` is called with the plaintext size of every chunk
+    verified; setting the threading.Event `cancel` raises DecryptionCancelled.
+    """
+    if io_policy not in IO_POLICIES:
+        raise ValueError(f"Unknown I/O policy: {io_policy}")
+    with open(input_file, 'rb') as infile:
+        nonce = read_header(infile)
+        fd = infile.fileno()
+        num_blocks = block_count(os.fstat(fd).st_size)
+        if workers <= 1 or not can_decrypt_parallel():
+            return verify_block_range(fd, data_key, nonce, 0, num_blocks, read_size,
+                                      io_policy, on_bytes, cancel)
+        ranges = split_block_ranges(num_blocks, workers * PARALLEL_RANGES_PER_WORKER)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(verify_block_range, fd, data_key, nonce, start, stop,
+                                   read_size, io_policy, on_bytes, cancel)
+                       for start, stop in ranges]
+            bad = [b for b in (future.result() for future in futures) if b is not None]
+        return min(bad) if bad else None
+
+def can_decrypt_parallel():
+    """Parallel decryption needs positional I/O, which is not available everywhere (e.g. Windows)."""
+    return hasattr(os, "preadv") and hasattr(os, "pwrite")
+
+def should_mmap(st):
+    """Pick the mmap path for regular files of at least MMAP_THRESHOLD bytes."""
+    return stat.S_ISREG(st.st_mode) and st.st_size >= MMAP_THRESHOLD
+
+def decrypt_file(input_file, data_key, dest_dir=None, **options):
+    """
+    Decrypt one rclone crypt file next to the input, or into `dest_dir`.
+    Returns 0 on success and 1 on failure; see decrypt_to for the options.
+    """
+    try:
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        decrypt_to(input_file, output_path_for(input_file, dest_dir), data_key, **options)
+    except Exception as e:
+        print("Decryption error:", e, "In:", input_file)
+        return 1
+    return 0
+
+def decrypt_to(input_file, output_file, data_key, workers=1, use_mmap=None,
+               preallocate=False, read_size=DEFAULT_READ_SIZE, io_policy=IO_POLICY_DEFAULT,
+               on_bytes=None, cancel=None, resume=False):
+    """
+    Decrypt one rclone crypt file into `output_file`. Raises ValueError for a
+    malformed file, CryptoError for a block that fails authentication and
+    OSError for I/O errors.
+    With `workers` > 1 the blocks are split into ranges and decrypted on a
+    thread pool; libsodium runs without the GIL, so this uses several cores.
+    `use_mmap` forces the memory-mapped input path on or off; by default it is
+    picked by file size. Pipes and other non-regular files always use buffered reads.
+    With `preallocate` the output is reserved at its final size up front and
+    blocks are written with pwrite at their offsets (always the case with workers > 1).
+    `read_size` is the ciphertext fetched per read syscall (rounded up to whole
+    blocks); the decrypted chunk is written back with a single call.
+    `io_policy` is one of IO_POLICIES and controls page-cache hints; the nocache
+    policies never use the mmap path, since mapped pages can't be dropped.
+    `on_bytes(count)` is called with the plaintext size of every chunk written,
+    from the decrypting threads.
+    `cancel` is a threading.Event checked before every chunk of `read_size`;
+    once it is set the decryption stops and DecryptionCancelled is raised.
+    An output that was cancelled or failed part-way is removed.
+    With `resume` a sidecar journal (see journal.py) records the blocks
+    written so far. A later call picks up after the last recorded block, once
+    that block has been checked against the output, and a cancelled or failed
+    output is kept for that. Resumed files are decrypted on one thread.
+    """
+    if io_policy not in IO_POLICIES:
+        raise ValueError(f"Unknown I/O policy: {io_policy}")
+    if workers > 1 and can_decrypt_parallel() and not resume:
+        _decrypt_file_parallel(input_file, output_file, data_key, workers, read_size,
+                               io_policy, on_bytes, cancel)
     else:
-        output_file = os.path.splitext(input_file)[0]
-    with open(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
-        magic = infile.read(FILE_MAGIC_SIZE)
-        if magic != FILE_MAGIC:
-            print("Invalid file header in:", input_file)
-            return 1
-        nonce = infile.read(FILE_NONCE_SIZE)
-        if len(nonce) != FILE_NONCE_SIZE:
-            print("Failed to read nonce from:", input_file)
-            return 1
-        print("Nonce:", nonce.hex())
-        i = 0
-        while True:
-            cipher_block = infile.read(BLOCK_SIZE)
-            if len(cipher_block) == 0:
-                break
-            if len(cipher_block) <= nacl.secret.SecretBox.MACBYTES:
-                print(f"Corrupted block {i} in:", input_file)
-                return 1
+        _decrypt_file_serial(input_file, output_file, data_key, use_mmap, preallocate,
+                             read_size, io_policy, on_bytes, cancel, resume)
+
+def _decrypt_file_serial(input_file, output_file, data_key, use_mmap, preallocate,
+                         read_size, io_policy, on_bytes, cancel, resume=False):
+    with open(input_file, 'rb') as infile:
+        nonce = read_header(infile)
+        st = os.fstat(infile.fileno())
+        regular = stat.S_ISREG(st.st_mode)
+        # Only regular files can be identified and seeked for a resume.
+        journal = Journal(output_file, st, nonce) if resume and regular else None
+        start = _resume_point(infile, output_file, journal, data_key, nonce) if journal else 0
+        outfile = open(output_file, 'r+b' if start else 'wb')
+        with _removed_on_error(output_file, keep=journal is not None), outfile:
+            decryptor = BlockDecryptor(data_key, nonce)
+            if journal:
+                decryptor.seek(nonce, start)
+                infile.seek(FILE_HEADER_SIZE + start * BLOCK_SIZE)
+                outfile.truncate(start * BLOCK_DATA_SIZE)
+                outfile.seek(start * BLOCK_DATA_SIZE)
+            hints = CacheHints(io_policy, infile.fileno(), outfile.fileno()) if regular else None
+            if use_mmap is None:
+                use_mmap = should_mmap(st) and not (hints and hints.drop)
+            # Mapping only works for regular files, and empty payloads need no map.
+            use_mmap = use_mmap and regular and st.st_size > FILE_HEADER_SIZE
+            # Positional writes need the final size, which only regular files give us.
+            # Journaled outputs are flushed through the page cache, so no O_DIRECT.
+            direct = (io_policy == IO_POLICY_DIRECT and regular and hasattr(os, "pwrite")
+                      and journal is None and enable_direct_output(outfile.fileno()))
+            positional = (preallocate or direct) and regular and hasattr(os, "pwrite")
+            plain_size = plaintext_size(st.st_size) if regular else None
+            if positional:
+                preallocate_output(outfile.fileno(), plain_size)
+            if start and on_bytes:
+                on_bytes(start * BLOCK_DATA_SIZE)
+            write = _block_writer(outfile, positional, direct, on_bytes)
+            if journal:
+                write = _Checkpointer(write, outfile, journal, start)
+            chunk_blocks = blocks_per_read(read_size)
             try:
-                box = nacl.secret.SecretBox(data_key)
-                plain_block = box.decrypt(cipher_block, nonce)
-            except Exception as e:
-                print("Decryption error:", e)
-                return 1
-            outfile.write(plain_block)
-            nonce = increment_nonce(nonce)
-            i += 1
-    return 0
+                if use_mmap:
+                    _decrypt_mapped(infile, write, decryptor, st.st_size, chunk_blocks, hints,
+                                    direct, cancel, start)
+                else:
+                    _decrypt_buffered(infile, write, decryptor, chunk_blocks, hints, direct,
+                                      cancel, start)
+            except BaseException:
+                if journal:
+                    # Keep what was written so far for the next attempt.
+                    write.checkpoint()
+                raise
+            if direct:
+                # Drop the padding written after the unaligned tail.
+                os.ftruncate(outfile.fileno(), plain_size)
+            if hints:
+                outfile.flush()
+                hints.finish()
+    if journal:
+        journal.remove()
+
+def _resume_point(infile, output_file, journal, data_key, nonce):
+    """
+    Block to resume decryption from: the journaled block count, provided the
+    last journaled block decrypts to what the output holds. 0 otherwise.
+    """
+    blocks = journal.load()
+    if not blocks:
+        return 0
+    try:
+        with open(output_file, 'rb') as outfile:
+            outfile.seek((blocks - 1) * BLOCK_DATA_SIZE)
+            written = outfile.read(BLOCK_DATA_SIZE)
+    except OSError:
+        return 0
+    infile.seek(FILE_HEADER_SIZE + (blocks - 1) * BLOCK_SIZE)
+    cipher_block = infile.read(BLOCK_SIZE)
+    decryptor = BlockDecryptor(data_key, nonce)
+    decryptor.seek(nonce, blocks - 1)
+    plain = bytearray(BLOCK_DATA_SIZE)
+    try:
+        plain_len = decryptor.open_block(cipher_block, plain)
+    except (ValueError, nacl.exceptions.CryptoError):
+        return 0
+    if plain_len != BLOCK_DATA_SIZE or written != plain:
+        print("Journal doesn't match the output, starting over:", output_file)
+        return 0
+    return blocks
+
+class _Checkpointer:
+    """
+    Wraps a block writer for resume mode: every JOURNAL_INTERVAL bytes the
+    output is flushed to disk and the number of complete blocks journaled.
+    """
+
+    def __init__(self, write, outfile, journal, start_block):
+        self._write = write
+        self._outfile = outfile
+        self._journal = journal
+        self._blocks = start_block
+        self._saved = start_block
+        self._unsaved = 0
+
+    def __call__(self, view, length, offset):
+        self._write(view, length, offset)
+        self._blocks = (offset + length) // BLOCK_DATA_SIZE
+        self._unsaved += length
+        if self._unsaved >= JOURNAL_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self._blocks == self._saved:
+            return
+        try:
+            self._outfile.flush()
+            getattr(os, "fdatasync", os.fsync)(self._outfile.fileno())
+            self._journal.save(self._blocks)
+        except OSError as e:
+            print("Could not update journal:", e)
+            return
+        self._saved = self._blocks
+        self._unsaved = 0
+
+def _block_writer(outfile, positional, direct=False, on_bytes=None):
+    """
+    Return write(plain_view, plain_len, offset): pwrite at the block offset, or
+    a plain sequential write. Direct writes are padded to DIRECT_IO_ALIGNMENT.
+    With `on_bytes` every write is also reported to it.
+    """
+    if positional:
+        fd = outfile.fileno()
+        if direct:
+            write = lambda view, length, offset: pwrite_full(fd, view[:_aligned_length(length)], offset)
+        else:
+            write = lambda view, length, offset: pwrite_full(fd, view[:length], offset)
+    else:
+        write = lambda view, length, offset: outfile.write(view[:length])
+    if on_bytes is None:
+        return write
+
+    def write_and_report(view, length, offset):
+        write(view, length, offset)
+        on_bytes(length)
+    return write_and_report
+
+def _decrypt_buffered(infile, write, decryptor, chunk_blocks, hints=None, direct=False,
+                      cancel=None, first_block=0):
+    # Many blocks are fetched per read and decrypted as slices of one buffer;
+    # both buffers are reused for every chunk of the file.
+    cipher_buf = bytearray(chunk_blocks * BLOCK_SIZE)
+    plain_buf = _plain_buffer(chunk_blocks * BLOCK_DATA_SIZE, direct)
+    try:
+        with memoryview(cipher_buf) as cipher_view, memoryview(plain_buf) as plain_view:
+            block = first_block
+            while True:
+                check_cancelled(cancel)
+                n = readinto_full(infile, cipher_buf)
+                if n == 0:
+                    break
+                if hints:
+                    hints.input_done(FILE_HEADER_SIZE + block * BLOCK_SIZE, n)
+                plain_len = decryptor.open_blocks(cipher_view[:n], plain_view, block)
+                write(plain_view, plain_len, block * BLOCK_DATA_SIZE)
+                if hints:
+                    hints.output_done(block * BLOCK_DATA_SIZE, plain_len)
+                if n < len(cipher_buf):
+                    break
+                block += chunk_blocks
+    finally:
+        if direct:
+            plain_buf.close()
+
+def _decrypt_mapped(infile, write, decryptor, cipher_size, chunk_blocks, hints=None, direct=False,
+                    cancel=None, first_block=0):
+    # Blocks are opened directly from slices of the mapping: no read syscalls
+    # and no copies of the ciphertext. Output is still written a chunk at a time.
+    chunk_size = chunk_blocks * BLOCK_SIZE
+    plain_buf = _plain_buffer(chunk_blocks * BLOCK_DATA_SIZE, direct)
+    try:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view, memoryview(plain_buf) as plain_view:
+                for offset in range(FILE_HEADER_SIZE + first_block * BLOCK_SIZE, cipher_size, chunk_size):
+                    check_cancelled(cancel)
+                    block = (offset - FILE_HEADER_SIZE) // BLOCK_SIZE
+                    with view[offset:offset + chunk_size] as cipher_chunk:
+                        plain_len = decryptor.open_blocks(cipher_chunk, plain_view, block)
+                    write(plain_view, plain_len, block * BLOCK_DATA_SIZE)
+                    if hints:
+                        hints.output_done(block * BLOCK_DATA_SIZE, plain_len)
+    finally:
+        if direct:
+            plain_buf.close()
+
+def _decrypt_file_parallel(input_file, output_file, data_key, workers, read_size, io_policy,
+                           on_bytes=None, cancel=None):
+    with open(input_file, 'rb') as infile:
+        outfile = open(output_file, 'wb')
+        with _removed_on_error(output_file), outfile:
+            _decrypt_ranges(infile, outfile, data_key, workers, read_size, io_policy, on_bytes, cancel)
+
+def _decrypt_ranges(infile, outfile, data_key, workers, read_size, io_policy, on_bytes, cancel):
+    nonce = read_header(infile)
+    cipher_size = os.fstat(infile.fileno()).st_size
+    plain_size = plaintext_size(cipher_size)
+    preallocate_output(outfile.fileno(), plain_size)
+    direct = io_policy == IO_POLICY_DIRECT and enable_direct_output(outfile.fileno())
+    ranges = split_block_ranges(block_count(cipher_size), workers * PARALLEL_RANGES_PER_WORKER)
+    # Set after the first failure, so the ranges still running stop at their next chunk.
+    stop_ranges = _StopEvent(cancel)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(decrypt_block_range, infile.fileno(), outfile.fileno(),
+                        data_key, nonce, start, stop, read_size, io_policy, direct, on_bytes,
+                        stop_ranges)
+            for start, stop in ranges
+        ]
+        try:
+            wait(futures, return_when=FIRST_EXCEPTION)
+        finally:
+            stop_ranges.set()
+            for future in futures:
+                future.cancel()
+    errors = [future.exception() for future in futures if not future.cancelled()]
+    errors = [e for e in errors if e is not None]
+    if errors:
+        # Ranges stopped by the first failure report DecryptionCancelled; raise the cause.
+        raise next((e for e in errors if not isinstance(e, DecryptionCancelled)), errors[0])
+    if direct:
+        os.ftruncate(outfile.fileno(), plain_size)
+
+def decrypt_range(input_file, data_key, offset, length, read_size=DEFAULT_READ_SIZE):
+    """
+    Decrypt `length` bytes of plaintext starting at `offset` and return them.
+    Only the blocks covering the range are read and opened: the file is seeked
+    straight to the first one and the nonce set to header nonce + block index,
+    so the cost depends on `length`, not on the file size. The range is clamped
+    to the end of the file. Raises ValueError for a bad header or range and
+    CryptoError if a covering block fails authentication.
+    """
+    if offset < 0 or length < 0:
+        raise ValueError("Offset and length must not be negative.")
+    with open(input_file, 'rb') as infile:
+        nonce = read_header(infile)
+        end = min(offset + length, plaintext_size(os.fstat(infile.fileno()).st_size))
+        if offset >= end:
+            return b''
+        first_block = offset // BLOCK_DATA_SIZE
+        last_block = (end - 1) // BLOCK_DATA_SIZE
+        decryptor = BlockDecryptor(data_key, nonce)
+        decryptor.seek(nonce, first_block)
+        infile.seek(FILE_HEADER_SIZE + first_block * BLOCK_SIZE)
+
+        chunk_blocks = min(blocks_per_read(read_size), last_block - first_block + 1)
+        cipher_buf = bytearray(chunk_blocks * BLOCK_SIZE)
+        plain_buf = bytearray(chunk_blocks * BLOCK_DATA_SIZE)
+        result = bytearray()
+        with memoryview(cipher_buf) as cipher_view, memoryview(plain_buf) as plain_view:
+            for block in range(first_block, last_block + 1, chunk_blocks):
+                count = min(chunk_blocks, last_block + 1 - block)
+                n = readinto_full(infile, cipher_view[:count * BLOCK_SIZE])
+                plain_len = decryptor.open_blocks(cipher_view[:n], plain_view, block)
+                chunk_start = block * BLOCK_DATA_SIZE
+                lo = max(offset, chunk_start) - chunk_start
+                hi = min(end, chunk_start + plain_len) - chunk_start
+                result += plain_view[lo:hi]
+        return bytes(result)
+
+def _source_chunks(source, read_size):
+    # Readable binary streams are read `read_size` at a time; anything else is
+    # treated as an iterable of byte chunks.
+    if hasattr(source, "read"):
+        while True:
+            data = source.read(read_size)
+            if not data:
+                return
+            yield data
+    else:
+        yield from source
+
+class StreamDecryptor:
+    """
+    Push-based decryption of a crypt stream. Data is fed in chunks split at
+    any boundary and plaintext comes back as a list of bytes chunks; only a
+    partial block and one chunk of plaintext are buffered between calls.
+    """
+
+    def __init__(self, data_key, read_size=DEFAULT_READ_SIZE):
+        self._data_key = data_key
+        self._chunk_blocks = blocks_per_read(read_size)
+        self._header = bytearray()
+        self._pending = bytearray()
+        self._plain_buf = bytearray(self._chunk_blocks * BLOCK_DATA_SIZE)
+        self._decryptor = None
+        self._block = 0
+
+    def feed(self, data):
+        """Consume `data` and return the plaintext chunks it completes."""
+        out = []
+        plain_view = memoryview(self._plain_buf)
+        with memoryview(data) as view:
+            if self._decryptor is None:
+                need = FILE_HEADER_SIZE - len(self._header)
+                self._header += view[:need]
+                view = view[need:]
+                if len(self._header) < FILE_HEADER_SIZE:
+                    return out
+                if self._header[:FILE_MAGIC_SIZE] != FILE_MAGIC:
+                    raise ValueError("Invalid file header.")
+                self._decryptor = BlockDecryptor(self._data_key, bytes(self._header[FILE_MAGIC_SIZE:]))
+            if self._pending:
+                need = BLOCK_SIZE - len(self._pending)
+                self._pending += view[:need]
+                view = view[need:]
+                if len(self._pending) < BLOCK_SIZE:
+                    return out
+                plain_len = self._decryptor.open_block(self._pending, plain_view)
+                self._pending.clear()
+                self._block += 1
+                out.append(bytes(plain_view[:plain_len]))
+            # Whole blocks are opened straight from the incoming chunk.
+            chunk_size = self._chunk_blocks * BLOCK_SIZE
+            full = len(view) - len(view) % BLOCK_SIZE
+            for offset in range(0, full, chunk_size):
+                with view[offset:min(offset + chunk_size, full)] as blocks:
+                    plain_len = self._decryptor.open_blocks(blocks, plain_view, self._block)
+                    self._block += len(blocks) // BLOCK_SIZE
+                out.append(bytes(plain_view[:plain_len]))
+            self._pending += view[full:]
+        return out
+
+    def finish(self):
+        """Signal end of stream; returns the plaintext of the final short block, if any."""
+        if self._decryptor is None:
+            raise ValueError("Failed to read nonce." if self._header else "Invalid file header.")
+        if not self._pending:
+            return []
+        if len(self._pending) <= BLOCK_HEADER_SIZE:
+            raise ValueError(f"Corrupted block {self._block}: too short to contain data.")
+        plain_len = self._decryptor.open_block(self._pending, self._plain_buf)
+        self._pending.clear()
+        return [bytes(self._plain_buf[:plain_len])]
+
+def decrypt_stream(source, data_key, read_size=DEFAULT_READ_SIZE):
+    """
+    Decrypt a crypt stream from `source` (a readable binary stream or an
+    iterable of byte chunks) and yield plaintext chunks as bytes.
+    Incoming chunks may split the header and blocks at any boundary; memory
+    stays bounded whatever the stream length. Raises ValueError for a bad
+    header or truncated block and CryptoError if a block fails authentication.
+    """
+    decryptor = StreamDecryptor(data_key, read_size)
+    for data in _source_chunks(source, read_size):
+        yield from decryptor.feed(data)
+    yield from decryptor.finish()
+
+def nonce_add(nonce, count):
+    """Return `nonce` advanced by `count` blocks (little-endian addition, wrapping)."""
+    nonce_int = (int.from_bytes(nonce, byteorder='little') + count) % (1 << (8 * FILE_NONCE_SIZE))
+    return nonce_int.to_bytes(FILE_NONCE_SIZE, byteorder='little')
 
 def increment_nonce(nonce):
     nonce_int = int.from_bytes(nonce, byteorder='little') + 1
-    return nonce_int.to_bytes(FILE_NONCE_SIZE, byteorder='little')
\ No newline at end of file
+    return nonce_int.to_bytes(FILE_NONCE_SIZE, byteorder='little')
@@ -1,15 +1,22 @@
 from typing import Optional
-from PyQt6.QtWidgets import QListWidget
+from PyQt6.QtWidgets import QListView
 from PyQt6.QtCore import pyqtSignal
 from PyQt6.QtGui import QDragEnterEvent, QDragMoveEvent, QDropEvent
 
-class DragDropListWidget(QListWidget):
-    filesAdded = pyqtSignal()  # Signal emitted when files are added
+class DragDropListView(QListView):
+    """
+    List view for the input files. Dropped paths are only reported through
+    pathsDropped; expanding folders and filling the model is up to the owner.
+    """
+    pathsDropped = pyqtSignal(list)  # Signal emitted with the dropped local paths
     
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAcceptDrops(True)
         self.setDragEnabled(True)
+        # Every row is one line of text, so the view never has to measure rows.
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
 
     def dragEnterEvent(self, e: Optional[QDragEnterEvent]):
         if e is not None:
@@ -31,11 +38,10 @@ class DragDropListWidget(QListWidget):
         if event is not None:
             mime_data = event.mimeData()
             if mime_data is not None and mime_data.hasUrls():
-                for url in mime_data.urls():
-                    file_path = url.toLocalFile()
-                    if file_path:
-                        self.addItem(file_path)
+                paths = [url.toLocalFile() for url in mime_data.urls()]
+                paths = [path for path in paths if path]
                 event.acceptProposedAction()
-                self.filesAdded.emit()  # Emit signal after adding files
+                if paths:
+                    self.pathsDropped.emit(paths)
                 return
-        super().dropEvent(event)
\ No newline at end of file
+        super().dropEvent(event)
@@ -0,0 +1,247 @@
+"""
+Model and background scanner for the input file list.
+
+Dropped folders can hold hundreds of thousands of files, so the list isn't
+made of QListWidgetItems. FileListModel keeps the entries in flat arrays:
+directories are interned, names are packed into one UTF-8 buffer, and the
+sizes go in an array. DirectoryScanner walks the dropped paths on its own
+thread and hands over the files it finds in batches.
+"""
+import os
+import time
+import threading
+from array import array
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QThread, pyqtSignal
+
+from scheduler import OutputNames
+from tree import walk_files, output_base
+
+# Files the scanner collects before handing them to the model, and the
+# longest it holds on to a partial batch.
+SCAN_BATCH_SIZE = 4096
+SCAN_BATCH_SECONDS = 0.1
+
+class ScanBatch:
+    """Files found by a scanner: parallel lists of directories, names, sizes and roots."""
+    __slots__ = ("dirs", "names", "sizes", "roots")
+
+    def __init__(self):
+        self.dirs = []
+        self.names = []
+        self.sizes = []
+        self.roots = []
+
+    def __len__(self):
+        return len(self.names)
+
+class DirectoryScanner(QThread):
+    """
+    Expands dropped files and folders into the files they contain, off the
+    GUI thread. Files whose ids are already in the FileIdSet `seen` are
+    skipped, and the new ones are added to it.
+    """
+    batch_found = pyqtSignal(object)    # Emits a ScanBatch
+
+    def __init__(self, paths, seen=None):
+        super().__init__()
+        self.paths = list(paths)
+        self.seen = seen
+        self._is_interrupted = False
+
+    def cancel(self):
+        self._is_interrupted = True
+
+    def run(self):
+        batch = ScanBatch()
+        started = time.monotonic()
+        for root in self.paths:
+            if os.path.isdir(root):
+                found = ((entry.path, entry, root) for entry, _ in walk_files(root))
+            else:
+                found = [(root, None, root)]
+            for path, entry, found_root in found:
+                if self._is_interrupted:
+                    return
+                try:
+                    st = entry.stat() if entry is not None else os.stat(path)
+                except OSError:
+                    continue
+                if self.seen is not None and not self.seen.add(st.st_dev, st.st_ino):
+                    continue
+                directory, name = os.path.split(path)
+                batch.dirs.append(directory)
+                batch.names.append(name)
+                batch.sizes.append(st.st_size)
+                batch.roots.append(found_root)
+                if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - started >= SCAN_BATCH_SECONDS:
+                    self.batch_found.emit(batch)
+                    batch = ScanBatch()
+                    started = time.monotonic()
+        if len(batch):
+            self.batch_found.emit(batch)
+
+class FileIdSet:
+    """
+    Set of (st_dev, st_ino) file ids kept in two flat arrays, an open-addressed
+    table with linear probing. Devices are interned, so a slot costs 12 bytes
+    where a set of tuples costs over a hundred per file. Safe to share
+    between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dev_lookup = {}   # st_dev -> index + 1; 0 marks a free slot
+        self._slot_devs = array("I", [0]) * 1024
+        self._slot_inos = array("Q", [0]) * 1024
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, dev, ino):
+        """Add a file id. Returns False if it was already there."""
+        with self._lock:
+            d = self._dev_lookup.get(dev)
+            if d is None:
+                d = self._dev_lookup[dev] = len(self._dev_lookup) + 1
+            # Grow at two thirds full, so probe runs stay short.
+            if (self._count + 1) * 3 > len(self._slot_devs) * 2:
+                self._grow()
+            if not self._insert(self._slot_devs, self._slot_inos, d, ino):
+                return False
+            self._count += 1
+            return True
+
+    @staticmethod
+    def _insert(devs, inos, d, ino):
+        mask = len(devs) - 1
+        i = hash((d, ino)) & mask
+        while devs[i]:
+            if inos[i] == ino and devs[i] == d:
+                return False
+            i = (i + 1) & mask
+        devs[i] = d
+        inos[i] = ino
+        return True
+
+    def _grow(self):
+        size = len(self._slot_devs) * 2
+        devs = array("I", [0]) * size
+        inos = array("Q", [0]) * size
+        for d, ino in zip(self._slot_devs, self._slot_inos):
+            if d:
+                self._insert(devs, inos, d, ino)
+        self._slot_devs = devs
+        self._slot_inos = inos
+
+class FileListSnapshot:
+    """
+    Read-only copy of the list taken when a decryption starts, so the worker
+    thread never sees the model change under it. Iterating yields paths.
+    """
+
+    def __init__(self, model):
+        self._dirs = tuple(model._dirs)
+        self._dir_index = array("I", model._dir_index)
+        self._names = bytes(model._names)
+        self._name_offsets = array("Q", model._name_offsets)
+        self._sizes = array("q", model._sizes)
+        self._roots = tuple(model._roots)
+        self._root_index = array("I", model._root_index)
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def path(self, row):
+        start, end = self._name_offsets[row], self._name_offsets[row + 1]
+        return os.path.join(self._dirs[self._dir_index[row]], self._names[start:end].decode("utf-8", "surrogateescape"))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.path(row)
+
+    def sizes(self):
+        return iter(self._sizes)
+
+    def tree_entries(self, dest_dir=None, names=None):
+        """(path, base, relative path, size) entries for tree.job_windows."""
+        bases = {}
+        taken = OutputNames()
+        for row in range(len(self)):
+            path = self.path(row)
+            root = self._roots[self._root_index[row]]
+            if root == path:
+                yield path, dest_dir or os.path.dirname(path), os.path.basename(path), self._sizes[row]
+                continue
+            base = bases.get(root)
+            if base is None:
+                base = bases[root] = taken.claim_path(output_base(root, dest_dir, names))
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            yield path, base, rel, self._sizes[row]
+
+class FileListModel(QAbstractListModel):
+    """
+    The input files, stored compactly. The scanners deduplicate files by
+    (device, inode) against `file_ids`, so dropping a folder twice adds nothing.
+    """
+    count_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.clear()
+
+    def clear(self):
+        self.beginResetModel()
+        self._dirs = []
+        self._dir_lookup = {}
+        self._dir_index = array("I")
+        self._names = bytearray()
+        self._name_offsets = array("Q", [0])
+        self._sizes = array("q")
+        self._roots = []
+        self._root_lookup = {}
+        self._root_index = array("I")
+        # Filled by the scanners; see DirectoryScanner.
+        self.file_ids = FileIdSet()
+        self.endResetModel()
+        self.count_changed.emit(0)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._sizes)
+
+    def path(self, row):
+        start, end = self._name_offsets[row], self._name_offsets[row + 1]
+        return os.path.join(self._dirs[self._dir_index[row]], self._names[start:end].decode("utf-8", "surrogateescape"))
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._sizes):
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self.path(index.row())
+        return None
+
+    def _intern(self, value, lookup, values):
+        i = lookup.get(value)
+        if i is None:
+            i = lookup[value] = len(values)
+            values.append(value)
+        return i
+
+    def add_batch(self, batch):
+        """Append the files of a ScanBatch."""
+        if not len(batch):
+            return
+        first = len(self._sizes)
+        self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+        for i in range(len(batch)):
+            self._dir_index.append(self._intern(batch.dirs[i], self._dir_lookup, self._dirs))
+            self._root_index.append(self._intern(batch.roots[i], self._root_lookup, self._roots))
+            self._names += batch.names[i].encode("utf-8", "surrogateescape")
+            self._name_offsets.append(len(self._names))
+            self._sizes.append(batch.sizes[i])
+        self.endInsertRows()
+        self.count_changed.emit(len(self._sizes))
+
+    def snapshot(self):
+        return FileListSnapshot(self)
@@ -0,0 +1,65 @@
+"""
+Sidecar journals for resumable decryption.
+
+While a file is decrypted in resume mode, a small JSON file next to the
+output records how many blocks have been written and flushed to disk, along
+with the identity of the input (size, mtime and header nonce). If the run is
+interrupted, the next one picks up after the last recorded block instead of
+starting over. The journal is removed once the output is complete.
+"""
+import json
+import os
+
+JOURNAL_SUFFIX = ".redexter-journal"
+JOURNAL_VERSION = 1
+# Plaintext written between two checkpoints. Each checkpoint costs an
+# fdatasync of the output, so this trades redone work against sync overhead.
+JOURNAL_INTERVAL = 64 * 1024 * 1024
+
+def journal_path(output_file):
+    return output_file + JOURNAL_SUFFIX
+
+class Journal:
+    """
+    Checkpoints of one output file. `st` is the os.stat_result of the input
+    and `nonce` its header nonce; a journal written for any other input is ignored.
+    """
+
+    def __init__(self, output_file, st, nonce):
+        self.path = journal_path(output_file)
+        self._identity = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "nonce": nonce.hex()}
+
+    def load(self):
+        """Blocks recorded as written, or 0 if there is no usable journal for this input."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print("Ignoring unreadable journal:", e)
+            return 0
+        if not isinstance(record, dict) or record.get("version") != JOURNAL_VERSION:
+            return 0
+        if any(record.get(k) != v for k, v in self._identity.items()):
+            # The input changed since the journal was written.
+            return 0
+        blocks = record.get("blocks")
+        return blocks if isinstance(blocks, int) and blocks > 0 else 0
+
+    def save(self, blocks):
+        """Record that the first `blocks` blocks of the output are on disk. Atomic."""
+        record = dict(self._identity, version=JOURNAL_VERSION, blocks=blocks)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        for path in (self.path, self.path + ".tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
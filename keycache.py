@@ -0,0 +1,136 @@
+"""
+Cache of scrypt-derived key material.
+
+Deriving a key costs a full scrypt run, so the 80 bytes of key material
+(data key, name key and name tweak) are kept in a small LRU cache
+keyed by a digest of the password, salt and KDF parameters. The password
+itself is never stored. Evicted and cleared keys are overwritten with zeros.
+With `persist=True` keys are also saved in the OS keyring (see
+config_storage), so later runs can skip the KDF altogether.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import crypto
+
+# Derived key material kept in memory.
+KEY_CACHE_SIZE = 8
+
+def key_digest(password, salt=None):
+    """Digest identifying a (password, salt, KDF parameters) combination."""
+    if salt is None:
+        salt = crypto.DEFAULT_SALT
+    h = hashlib.blake2b(digest_size=32, person=b"redexter-kdf")
+    # Length-prefix every field so different splits can't collide.
+    for field in (password.encode('utf-8'), crypto.salt_bytes(salt), repr(crypto.KDF_PARAMS).encode()):
+        h.update(len(field).to_bytes(8, "little"))
+        h.update(field)
+    return h.hexdigest()
+
+def _wipe(buf):
+    buf[:] = bytes(len(buf))
+
+class KeyCache:
+    """LRU cache of derived keys. Safe to share between threads."""
+
+    def __init__(self, maxsize=KEY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        # Digest -> Event for derivations in progress, so concurrent requests
+        # for the same key wait for one scrypt run instead of starting another.
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, password, salt=None, persist=False):
+        """Return the key material for `password` and `salt`, deriving it only on a miss."""
+        digest = key_digest(password, salt)
+        while True:
+            with self._lock:
+                key = self._keys.get(digest)
+                if key is not None:
+                    self._keys.move_to_end(digest)
+                    return bytes(key)
+                pending = self._pending.get(digest)
+                if pending is None:
+                    pending = self._pending[digest] = threading.Event()
+                    break
+            # Another thread is deriving this key; if it fails we try ourselves.
+            pending.wait()
+        try:
+            key = _load_persisted(digest) if persist else None
+            if key is None:
+                key = crypto.make_key_material(password, salt)
+                if persist:
+                    _save_persisted(digest, key)
+            self._store(digest, key)
+            return key
+        finally:
+            with self._lock:
+                del self._pending[digest]
+            pending.set()
+
+    def _store(self, digest, key):
+        with self._lock:
+            old = self._keys.pop(digest, None)
+            if old is not None:
+                _wipe(old)
+            self._keys[digest] = bytearray(key)
+            while len(self._keys) > self.maxsize:
+                _, evicted = self._keys.popitem(last=False)
+                _wipe(evicted)
+
+    def forget(self, password, salt=None):
+        """Evict and wipe one key. Returns True if it was cached."""
+        with self._lock:
+            key = self._keys.pop(key_digest(password, salt), None)
+        if key is None:
+            return False
+        _wipe(key)
+        return True
+
+    def clear(self):
+        """Evict and wipe every cached key."""
+        with self._lock:
+            keys = list(self._keys.values())
+            self._keys.clear()
+        for key in keys:
+            _wipe(key)
+
+def _load_persisted(digest):
+    try:
+        import config_storage
+        return config_storage.get_derived_key(digest)
+    except Exception as e:
+        print("Error reading stored key:", e)
+        return None
+
+def _save_persisted(digest, key):
+    try:
+        import config_storage
+        config_storage.set_derived_key(digest, key)
+    except Exception as e:
+        print("Error storing derived key:", e)
+
+_default_cache = KeyCache()
+
+def derive_key_material(password, salt=None, persist=False):
+    """Cached crypto.make_key_material. With `persist` it is also kept in the OS keyring."""
+    return _default_cache.get(password, salt, persist)
+
+def derive_key(password, salt=None, persist=False):
+    """Cached crypto.make_key; the data key only."""
+    return derive_key_material(password, salt, persist)[:crypto.DATA_KEY_SIZE]
+
+def forget_key(password, salt=None):
+    return _default_cache.forget(password, salt)
+
+def clear_keys(persisted=False):
+    """Wipe all cached keys, and with `persisted` also the ones saved in the keyring."""
+    _default_cache.clear()
+    if persisted:
+        import config_storage
+        config_storage.clear_derived_keys()
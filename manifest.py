@@ -0,0 +1,150 @@
+"""
+Manifest of decrypted files for incremental runs.
+
+A small SQLite database records, for every input decrypted successfully,
+the identity of the ciphertext (path, size, mtime and header nonce) and the
+size and mtime of the output written for it. On the next run, inputs whose
+identity is unchanged and whose output is still in place are skipped, so a
+rerun over a mostly unchanged directory only decrypts what changed.
+"""
+import os
+import sqlite3
+
+import crypto
+
+MANIFEST_NAME = ".redexter-manifest.db"
+# Results are committed in batches of this many files (and at the end).
+MANIFEST_COMMIT_INTERVAL = 500
+# Inputs looked up per query; stays below SQLite's bound-parameter limit.
+MANIFEST_QUERY_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    nonce BLOB NOT NULL,
+    output TEXT NOT NULL,
+    output_size INTEGER NOT NULL,
+    output_mtime_ns INTEGER NOT NULL
+)
+"""
+
+def default_manifest_path(dest_dir=None):
+    """The manifest in `dest_dir`, or in ~/.redexter for outputs written next to their inputs."""
+    if dest_dir:
+        return os.path.join(dest_dir, MANIFEST_NAME)
+    return os.path.join(os.path.expanduser("~"), ".redexter", "manifest.db")
+
+def _read_nonce(path):
+    with open(path, 'rb') as f:
+        return crypto.read_header(f)
+
+class Manifest:
+    """
+    An open manifest. Not thread-safe: use it from the thread that created
+    it, which is where scheduler.run_tasks calls on_result.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(_SCHEMA)
+        self._pending = []
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _rows(self, paths):
+        rows = {}
+        for i in range(0, len(paths), MANIFEST_QUERY_BATCH):
+            chunk = paths[i:i + MANIFEST_QUERY_BATCH]
+            query = "SELECT * FROM files WHERE path IN (%s)" % ",".join("?" * len(chunk))
+            for row in self._db.execute(query, chunk):
+                rows[row[0]] = row
+        return rows
+
+    def _is_current(self, job, row):
+        _, size, mtime_ns, nonce, output, output_size, output_mtime_ns = row
+        try:
+            st = os.stat(job.path)
+            out = os.stat(job.output_file)
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) or output != os.path.abspath(job.output_file):
+            return False
+        if (out.st_size, out.st_mtime_ns) != (output_size, output_mtime_ns):
+            return False
+        # Size and mtime can survive a rewrite; a new encryption always has a new nonce.
+        try:
+            return _read_nonce(job.path) == nonce
+        except (OSError, ValueError):
+            return False
+
+    def select(self, jobs):
+        """
+        Return the scheduler.FileJobs that need decrypting. The others are
+        marked with `skipped = True`.
+        """
+        rows = self._rows([os.path.abspath(job.path) for job in jobs])
+        todo = []
+        for job in jobs:
+            row = rows.get(os.path.abspath(job.path))
+            if row is not None and self._is_current(job, row):
+                job.skipped = True
+            else:
+                todo.append(job)
+        return todo
+
+    def select_windows(self, job_windows, on_skip=None):
+        """
+        select() for each list of jobs from `job_windows` (see tree.job_windows),
+        calling `on_skip(job)` for every skipped job.
+        """
+        for jobs in job_windows:
+            todo = self.select(jobs)
+            if on_skip and len(todo) < len(jobs):
+                for job in jobs:
+                    if job.skipped:
+                        on_skip(job)
+            yield todo
+
+    def record(self, job):
+        """Remember a successfully decrypted job. Failed and skipped jobs are ignored."""
+        if job.error is not None or job.skipped:
+            return
+        try:
+            st = os.stat(job.path)
+            out = os.stat(job.output_file)
+            nonce = _read_nonce(job.path)
+        except (OSError, ValueError) as e:
+            print("Not recording in manifest:", e)
+            return
+        self._pending.append((os.path.abspath(job.path), st.st_size, st.st_mtime_ns, nonce,
+                              os.path.abspath(job.output_file), out.st_size, out.st_mtime_ns))
+        if len(self._pending) >= MANIFEST_COMMIT_INTERVAL:
+            self.commit()
+
+    def recorder(self, on_result=None):
+        """An on_result callback for scheduler.run_tasks that records each job, then calls `on_result`."""
+        def record_and_forward(job):
+            self.record(job)
+            if on_result:
+                on_result(job)
+        return record_and_forward
+
+    def commit(self):
+        if self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 self._pending)
+            self._pending.clear()
+        self._db.commit()
@@ -0,0 +1,365 @@
+"""
+Decryption of rclone crypt file and directory names.
+
+With filename_encryption = standard, rclone encrypts every path segment on
+its own. The segment is PKCS#7-padded to 16 bytes. It is then encrypted
+with EME (a wide-block mode built on AES-256) under the name key and name
+tweak, and written out in the remote's filename encoding (base32, base64
+or base32768).
+
+A NameDecryptor remembers decrypted segments and directory prefixes, so a
+tree only pays for each distinct name once. decrypt_paths pushes all new
+segments of a batch through AES together, three ECB calls per batch.
+"""
+import base64
+import binascii
+import re
+from collections import OrderedDict
+
+from Crypto.Cipher import AES
+
+import crypto
+
+NAME_ENCRYPTION_STANDARD = "standard"
+NAME_ENCRYPTION_OFF = "off"
+NAME_ENCRYPTION_MODES = (NAME_ENCRYPTION_STANDARD, NAME_ENCRYPTION_OFF)
+NAME_ENCODINGS = ("base32", "base64", "base32768")
+# Suffix rclone adds to file names when filename_encryption = off.
+UNENCRYPTED_SUFFIX = ".bin"
+
+NAME_BLOCK_SIZE = 16
+# EME handles at most 128 blocks.
+MAX_NAME_CIPHERTEXT = 128 * NAME_BLOCK_SIZE
+# Decrypted segments and directory prefixes kept per NameDecryptor.
+SEGMENT_CACHE_SIZE = 1 << 16
+# Segments pushed through AES together by decrypt_paths.
+NAME_BATCH_SIZE = 4096
+
+class NameDecryptionError(ValueError):
+    """Raised for a name that isn't a valid encrypted rclone name."""
+
+# --- Filename encodings ---
+
+_BASE32_NAME = re.compile(r"[0-9a-vA-V]*")
+
+def decode_base32(name):
+    """rclone's base32: base32hex without padding, lowercase on write, any case on read."""
+    # base32hex uses the same digits as int(..., 32), which is much faster
+    # than base64.b32hexdecode.
+    bits = len(name) * 5
+    if bits % 8 >= 5 or not _BASE32_NAME.fullmatch(name):
+        raise NameDecryptionError(f"Bad base32 name: {name}")
+    if not name:
+        return b""
+    return (int(name, 32) >> (bits % 8)).to_bytes(bits // 8, "big")
+
+def decode_base64(name):
+    """rclone's base64: URL-safe base64 without padding."""
+    padding = "=" * (-len(name) % 4)
+    try:
+        return base64.urlsafe_b64decode(name + padding)
+    except (binascii.Error, ValueError) as e:
+        raise NameDecryptionError(f"Bad base64 name {name}: {e}")
+
+# base32768 code point ranges, as (first, last) pairs: 15 bits per character,
+# and 7 bits for a final character that carries fewer than 8 bits.
+_BASE32768_PAIRS_15 = ("ҠҿԀԟڀڿݠޟ߀ߟကဟႠႿᄀᅟᆀᆟᇠሿበቿዠዿጠጿᎠᏟᐠᙟᚠᛟកសᠠᡟᣀᣟᦀᦟ᧠᧿ᨠᨿᯀᯟᰀᰟᴀᴟ⇠⇿"
+                       "⋀⋟⍀⏟␀␟─❟➀➿⠀⥿⦠⦿⨠⩟⪀⪿⫠⭟ⰀⰟⲀⳟⴀⴟⵀⵟ⺠⻟㇀㇟㐀䶟䷀龿ꀀꑿ꒠꒿ꔀꗿꙀꙟꚠꛟ꜀ꝟꞀꞟꡀꡟ")
+_BASE32768_PAIRS_7 = "ƀƟɀʟ"
+_base32768_table = None
+
+def _base32768_lookup():
+    # Code point -> (value, bits), built on first use.
+    global _base32768_table
+    if _base32768_table is None:
+        table = {}
+        for pairs, bits in ((_BASE32768_PAIRS_15, 15), (_BASE32768_PAIRS_7, 7)):
+            value = 0
+            for i in range(0, len(pairs), 2):
+                for point in range(ord(pairs[i]), ord(pairs[i + 1]) + 1):
+                    table[chr(point)] = (value, bits)
+                    value += 1
+        _base32768_table = table
+    return _base32768_table
+
+def decode_base32768(name):
+    """qntm's base32768, as used by rclone for backends with UTF-16 name limits."""
+    table = _base32768_lookup()
+    acc = 0
+    num_bits = 0
+    for i, char in enumerate(name):
+        try:
+            value, bits = table[char]
+        except KeyError:
+            raise NameDecryptionError(f"Bad base32768 name {name}: invalid character {char!r}")
+        if bits == 7 and i != len(name) - 1:
+            raise NameDecryptionError(f"Bad base32768 name {name}: short character before the end")
+        acc = (acc << bits) | value
+        num_bits += bits
+    padding = num_bits % 8
+    # The bits after the last whole byte are padding and must all be ones.
+    if acc & ((1 << padding) - 1) != (1 << padding) - 1:
+        raise NameDecryptionError(f"Bad base32768 name {name}: bad padding")
+    return (acc >> padding).to_bytes(num_bits // 8, "big")
+
+_DECODERS = {
+    "base32": decode_base32,
+    "base64": decode_base64,
+    "base32768": decode_base32768,
+}
+
+# --- EME ---
+
+_BLOCK_MASK = (1 << 128) - 1
+
+def _times_two(x):
+    # Doubling in GF(2^128); blocks are little-endian integers, as in EME.
+    x <<= 1
+    if x >> 128:
+        x = (x & _BLOCK_MASK) ^ 0x87
+    return x
+
+def _blocks(data):
+    return [int.from_bytes(data[i:i + NAME_BLOCK_SIZE], "little")
+            for i in range(0, len(data), NAME_BLOCK_SIZE)]
+
+def _join(blocks):
+    return b"".join(b.to_bytes(NAME_BLOCK_SIZE, "little") for b in blocks)
+
+class EME:
+    """
+    EME (ECB-Mix-ECB) wide-block encryption over AES, compatible with
+    github.com/rfjakob/eme used by rclone. Works on batches of messages so
+    that every AES step is a single ECB call.
+    """
+
+    def __init__(self, key, tweak):
+        if len(tweak) != NAME_BLOCK_SIZE:
+            raise ValueError(f"Tweak must be {NAME_BLOCK_SIZE} bytes long.")
+        self._ecb = AES.new(key, AES.MODE_ECB)
+        self._tweak = int.from_bytes(tweak, "little")
+        # L_j = 2^(j+1) * AES(0), for every block position EME allows.
+        l = int.from_bytes(self._ecb.encrypt(bytes(NAME_BLOCK_SIZE)), "little")
+        self._l_table = []
+        for _ in range(MAX_NAME_CIPHERTEXT // NAME_BLOCK_SIZE):
+            l = _times_two(l)
+            self._l_table.append(l)
+
+    def decrypt(self, messages):
+        return self._transform(messages, self._ecb.decrypt)
+
+    def encrypt(self, messages):
+        return self._transform(messages, self._ecb.encrypt)
+
+    def _transform(self, messages, aes):
+        l_table = self._l_table
+        tweak = self._tweak
+        sizes = []
+        masked = []
+        for data in messages:
+            if not data or len(data) % NAME_BLOCK_SIZE or len(data) > MAX_NAME_CIPHERTEXT:
+                raise ValueError(f"EME input must be 1 to 128 blocks, not {len(data)} bytes.")
+            blocks = _blocks(data)
+            sizes.append(len(blocks))
+            masked.extend(b ^ l_table[j] for j, b in enumerate(blocks))
+        ppp = _blocks(aes(_join(masked)))
+
+        mp = []
+        pos = 0
+        for m in sizes:
+            x = tweak
+            for b in ppp[pos:pos + m]:
+                x ^= b
+            mp.append(x)
+            pos += m
+        mc = _blocks(aes(_join(mp)))
+
+        ccc = []
+        pos = 0
+        for m, mp_i, mc_i in zip(sizes, mp, mc):
+            mask = mp_i ^ mc_i
+            rest = []
+            first = mc_i ^ tweak
+            for b in ppp[pos + 1:pos + m]:
+                mask = _times_two(mask)
+                b ^= mask
+                first ^= b
+                rest.append(b)
+            ccc.append(first)
+            ccc.extend(rest)
+            pos += m
+        cc = _blocks(aes(_join(ccc)))
+
+        out = []
+        pos = 0
+        for m in sizes:
+            out.append(_join(cc[pos + j] ^ l_table[j] for j in range(m)))
+            pos += m
+        return out
+
+def pkcs7_unpad(data):
+    if not data or len(data) % NAME_BLOCK_SIZE:
+        raise NameDecryptionError("Decrypted name has a bad length.")
+    n = data[-1]
+    if not 1 <= n <= NAME_BLOCK_SIZE or data[-n:] != bytes([n]) * n:
+        raise NameDecryptionError("Decrypted name has bad padding.")
+    return data[:-n]
+
+def pkcs7_pad(data):
+    n = NAME_BLOCK_SIZE - len(data) % NAME_BLOCK_SIZE
+    return data + bytes([n]) * n
+
+# --- Names and paths ---
+
+class _LRU(OrderedDict):
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def lookup(self, key):
+        value = self.get(key)
+        if value is not None:
+            self.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self[key] = value
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+class NameDecryptor:
+    """
+    Decrypts the names of one crypt remote.
+
+    `key_material` is the 80 bytes from crypto.make_key_material (or
+    keycache.derive_key_material). `mode`, `encoding` and
+    `directory_names` mirror the remote's filename_encryption,
+    filename_encoding and directory_name_encryption settings.
+    Not thread-safe; use one per thread.
+    """
+
+    def __init__(self, key_material, mode=NAME_ENCRYPTION_STANDARD, encoding="base32",
+                 directory_names=True, cache_size=SEGMENT_CACHE_SIZE):
+        if mode not in NAME_ENCRYPTION_MODES:
+            raise ValueError(f"Unsupported filename encryption: {mode}")
+        if encoding not in _DECODERS:
+            raise ValueError(f"Unknown filename encoding: {encoding}")
+        _, name_key, name_tweak = crypto.split_key_material(key_material)
+        self.mode = mode
+        self.encoding = encoding
+        self.directory_names = directory_names
+        self._decode = _DECODERS[encoding]
+        self._eme = EME(name_key, name_tweak)
+        self._segments = _LRU(cache_size)
+        self._dirs = _LRU(cache_size)
+
+    @classmethod
+    def from_password(cls, password, salt=None, **options):
+        import keycache
+        return cls(keycache.derive_key_material(password, salt), **options)
+
+    def _ciphertext(self, segment):
+        data = self._decode(segment)
+        if not data:
+            raise NameDecryptionError(f"Name {segment} is too short.")
+        if len(data) % NAME_BLOCK_SIZE:
+            raise NameDecryptionError(f"Name {segment} is not a whole number of blocks.")
+        if len(data) > MAX_NAME_CIPHERTEXT:
+            raise NameDecryptionError(f"Name {segment} is too long.")
+        return data
+
+    def _decrypt_new_segments(self, segments):
+        # Returns {segment: plaintext or NameDecryptionError} for uncached segments.
+        results = {}
+        valid = []
+        for segment in segments:
+            try:
+                valid.append((segment, self._ciphertext(segment)))
+            except NameDecryptionError as e:
+                results[segment] = e
+        for start in range(0, len(valid), NAME_BATCH_SIZE):
+            batch = valid[start:start + NAME_BATCH_SIZE]
+            plains = self._eme.decrypt([data for _, data in batch])
+            for (segment, _), padded in zip(batch, plains):
+                try:
+                    name = pkcs7_unpad(padded).decode("utf-8")
+                except (NameDecryptionError, UnicodeDecodeError) as e:
+                    results[segment] = NameDecryptionError(f"Failed to decrypt name {segment}: {e}")
+                    continue
+                results[segment] = name
+                self._segments.store(segment, name)
+        return results
+
+    def decrypt_segment(self, segment):
+        """Decrypt one file or directory name."""
+        return self._segment(segment)
+
+    def _segment(self, segment, known=None):
+        # `known` holds the results of a batch, which may be larger than the cache.
+        if self.mode == NAME_ENCRYPTION_OFF or not segment:
+            return segment
+        if known is not None and segment in known:
+            name = known[segment]
+        else:
+            name = self._segments.lookup(segment)
+            if name is None:
+                name = self._decrypt_new_segments([segment])[segment]
+        if isinstance(name, NameDecryptionError):
+            raise name
+        return name
+
+    def decrypt_name(self, name):
+        """Decrypt a file's own name (the last path segment)."""
+        return self._name(name)
+
+    def _name(self, name, known=None):
+        if self.mode == NAME_ENCRYPTION_OFF:
+            if not name.endswith(UNENCRYPTED_SUFFIX):
+                raise NameDecryptionError(f"Name {name} has no {UNENCRYPTED_SUFFIX} suffix.")
+            return name[:-len(UNENCRYPTED_SUFFIX)]
+        return self._segment(name, known)
+
+    def _dir(self, directory, known=None):
+        if not directory or self.mode == NAME_ENCRYPTION_OFF or not self.directory_names:
+            return directory
+        plain = self._dirs.lookup(directory)
+        if plain is None:
+            # Parents are looked up first, so siblings share the work for their prefix.
+            parent, _, name = directory.rpartition("/")
+            plain_name = self._segment(name, known)
+            plain = f"{self._dir(parent, known)}/{plain_name}" if parent else plain_name
+            self._dirs.store(directory, plain)
+        return plain
+
+    def decrypt_path(self, path):
+        """Decrypt a '/'-separated remote path of a file."""
+        return self._path(path)
+
+    def _path(self, path, known=None):
+        directory, _, name = path.rpartition("/")
+        plain_name = self._name(name, known)
+        return f"{self._dir(directory, known)}/{plain_name}" if directory else plain_name
+
+    def decrypt_paths(self, paths):
+        """
+        Decrypt many file paths at once. Returns a list in the same order,
+        with None for each path that can't be decrypted.
+        """
+        known = None
+        if self.mode == NAME_ENCRYPTION_STANDARD:
+            new = set()
+            for path in paths:
+                directory, _, name = path.rpartition("/")
+                if name and self._segments.lookup(name) is None:
+                    new.add(name)
+                if directory and self.directory_names and self._dirs.lookup(directory) is None:
+                    new.update(s for s in directory.split("/")
+                               if s and self._segments.lookup(s) is None)
+            known = self._decrypt_new_segments(new)
+        results = []
+        for path in paths:
+            try:
+                results.append(self._path(path, known))
+            except NameDecryptionError:
+                results.append(None)
+        return results
@@ -0,0 +1,254 @@
+"""
+Streaming reader / decryptor / writer pipeline for crypt files.
+
+A reader thread reads multi-block chunks into a bounded queue, a pool of
+decrypt threads opens them, and a writer thread puts the chunks back in order
+and writes them out. Reading, libsodium and writing therefore overlap instead
+of taking turns. The reader moves on to the next file of a batch (header and
+first chunks) as soon as the current one has been read, while the writer is
+still flushing it.
+"""
+import os
+import queue
+import threading
+
+import crypto
+from scheduler import DecryptionError, FileJob, POLL_INTERVAL
+
+# Chunks that may wait between the reader and the decrypt threads.
+READ_QUEUE_DEPTH = 8
+# Chunks that may wait between the decrypt threads and the writer.
+WRITE_QUEUE_DEPTH = 8
+
+class _FileState:
+    def __init__(self, path, output_file):
+        self.path = path
+        self.output_file = output_file
+        self.nonce = None
+
+class _Chunk:
+    __slots__ = ("seq", "file", "first_block", "first", "last",
+                 "cipher", "length", "plain", "plain_len")
+
+    def __init__(self, seq, file, first_block, first, cipher, plain):
+        self.seq = seq
+        self.file = file
+        self.first_block = first_block
+        self.first = first
+        self.last = False
+        self.cipher = cipher
+        self.length = 0
+        self.plain = plain
+        self.plain_len = 0
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
+
+def run_pipeline(files, data_key, dest_dir=None, workers=2,
+                 read_depth=READ_QUEUE_DEPTH, write_depth=WRITE_QUEUE_DEPTH,
+                 read_size=crypto.DEFAULT_READ_SIZE, io_policy=crypto.IO_POLICY_DEFAULT,
+                 progress=None, cancel=None):
+    """
+    Decrypt `files` through the pipeline. Each entry is either a path, written
+    to crypto.output_path_for(path, dest_dir), or a scheduler.FileJob, written
+    to its output_file as planned (renamed, space-checked). Yields the number of files finished
+    since the last yield (0 every POLL_INTERVAL while waiting), the same way
+    scheduler.run_tasks does. Closing the generator stops all stages.
+    Raises DecryptionError for the first file that fails.
+
+    Each chunk holds `read_size` bytes of ciphertext, rounded up to whole
+    blocks. At most read_depth + write_depth + workers chunks exist at any
+    time, so memory stays around that many times 2 * read_size.
+
+    `io_policy` applies the same page-cache hints as crypto.decrypt_file;
+    the writer goes through the page cache, so "direct" behaves like "nocache".
+
+    `progress` is a progress.Progress that counts the bytes written, reported
+    from the caller's thread as in scheduler.run_tasks. Setting the
+    threading.Event `cancel` stops all stages and raises
+    crypto.DecryptionCancelled. A file whose output was only partly written
+    when the pipeline stopped is removed.
+    """
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    workers = max(1, workers)
+    chunk_blocks = crypto.blocks_per_read(read_size)
+    stop = threading.Event()
+    errors = []
+    error_lock = threading.Lock()
+    read_q = queue.Queue(maxsize=max(1, read_depth))
+    write_q = queue.Queue(maxsize=max(1, write_depth))
+    done_q = queue.Queue()
+    slots = threading.Semaphore(max(1, read_depth) + max(1, write_depth) + workers)
+    # Chunk buffers are recycled by the writer, so steady state allocates nothing.
+    free_buffers = queue.SimpleQueue()
+    finished = object()
+
+    def fail(path, e):
+        with error_lock:
+            if not errors:
+                errors.append(e if isinstance(e, DecryptionError) else DecryptionError(path, str(e)))
+        stop.set()
+
+    def take_buffers():
+        try:
+            return free_buffers.get_nowait()
+        except queue.Empty:
+            return (bytearray(chunk_blocks * crypto.BLOCK_SIZE),
+                    bytearray(chunk_blocks * crypto.BLOCK_DATA_SIZE))
+
+    def reader():
+        seq = 0
+        path = None
+        try:
+            for item in files:
+                if stop.is_set():
+                    return
+                if isinstance(item, FileJob):
+                    path, output_file = item.path, item.output_file
+                else:
+                    path, output_file = item, crypto.output_path_for(item, dest_dir)
+                state = _FileState(path, output_file)
+                with open(path, 'rb') as infile:
+                    state.nonce = crypto.read_header(infile)
+                    hints = crypto.CacheHints(io_policy, in_fd=infile.fileno())
+                    block = 0
+                    while True:
+                        while not slots.acquire(timeout=POLL_INTERVAL):
+                            if stop.is_set():
+                                return
+                        cipher, plain = take_buffers()
+                        chunk = _Chunk(seq, state, block, block == 0, cipher, plain)
+                        chunk.length = crypto.readinto_full(infile, cipher)
+                        chunk.last = chunk.length < len(cipher)
+                        hints.input_done(crypto.FILE_HEADER_SIZE + block * crypto.BLOCK_SIZE,
+                                         chunk.length)
+                        if not _put(read_q, chunk, stop):
+                            return
+                        seq += 1
+                        block += chunk_blocks
+                        if chunk.last:
+                            break
+        except Exception as e:
+            fail(path, e)
+        finally:
+            for _ in range(workers):
+                _put(read_q, None, stop)
+
+    def decrypt_worker():
+        while True:
+            chunk = _get(read_q, stop)
+            if chunk is None:
+                break
+            try:
+                decryptor = crypto.BlockDecryptor(data_key, chunk.file.nonce)
+                decryptor.seek(chunk.file.nonce, chunk.first_block)
+                with memoryview(chunk.cipher) as view:
+                    chunk.plain_len = decryptor.open_blocks(view[:chunk.length], chunk.plain,
+                                                            chunk.first_block)
+            except Exception as e:
+                fail(chunk.file.path, e)
+                break
+            if not _put(write_q, chunk, stop):
+                break
+        _put(write_q, None, stop)
+
+    def writer():
+        pending = {}
+        next_seq = 0
+        running = workers
+        outfile = None
+        output_file = None
+        hints = None
+        path = None
+        try:
+            while running:
+                chunk = _get(write_q, stop)
+                if chunk is None:
+                    if stop.is_set():
+                        return
+                    running -= 1
+                    continue
+                pending[chunk.seq] = chunk
+                while next_seq in pending:
+                    chunk = pending.pop(next_seq)
+                    path = chunk.file.path
+                    if chunk.first:
+                        output_file = chunk.file.output_file
+                        outfile = open(output_file, 'wb')
+                        hints = crypto.CacheHints(io_policy, out_fd=outfile.fileno())
+                    with memoryview(chunk.plain) as view:
+                        outfile.write(view[:chunk.plain_len])
+                    hints.output_done(chunk.first_block * crypto.BLOCK_DATA_SIZE, chunk.plain_len)
+                    if progress is not None:
+                        progress.add_bytes(chunk.plain_len)
+                    free_buffers.put((chunk.cipher, chunk.plain))
+                    slots.release()
+                    if chunk.last:
+                        outfile.flush()
+                        hints.finish()
+                        outfile.close()
+                        outfile = None
+                        if progress is not None:
+                            progress.file_done()
+                        done_q.put(1)
+                    next_seq += 1
+        except Exception as e:
+            fail(path, e)
+        finally:
+            if outfile is not None:
+                outfile.close()
+                crypto.remove_partial(output_file)
+            done_q.put(finished)
+
+    threads = [threading.Thread(target=reader, daemon=True),
+               threading.Thread(target=writer, daemon=True)]
+    threads += [threading.Thread(target=decrypt_worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            crypto.check_cancelled(cancel)
+            try:
+                item = done_q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                item = 0
+            if progress is not None:
+                progress.report(force=item is finished)
+            if item is finished:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def decrypt_pipelined(files, data_key, dest_dir=None, workers=2, **pipeline_options):
+    """Decrypt a list of files through the pipeline. Raises DecryptionError on failure."""
+    for _ in run_pipeline(files, data_key, dest_dir, workers, **pipeline_options):
+        pass
+
+def decrypt_file_pipelined(input_file, data_key, dest_dir=None, workers=2, **pipeline_options):
+    """Pipelined counterpart of crypto.decrypt_file. Returns 0 on success and 1 on failure."""
+    try:
+        decrypt_pipelined([input_file], data_key, dest_dir, workers, **pipeline_options)
+    except DecryptionError as e:
+        print(e)
+        return 1
+    return 0
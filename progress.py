@@ -0,0 +1,124 @@
+"""
+Byte-level progress reporting for batch decryption.
+
+Workers add plaintext bytes to a Progress as each chunk is written, from any
+thread. The runners (scheduler.run_tasks, pipeline.run_pipeline) call
+Progress.report from the caller's thread, which hands a ProgressInfo to the
+callback at most once per interval, so a large batch doesn't flood the caller
+and a single huge file still moves.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+import crypto
+
+# Least time between two progress callbacks, in seconds.
+PROGRESS_INTERVAL = 0.1
+# Throughput is averaged over this many seconds.
+RATE_WINDOW = 5.0
+
+class ProgressInfo(namedtuple("ProgressInfo", "done_bytes total_bytes files_done total_files rate eta")):
+    """
+    One progress report. `rate` is in plaintext bytes per second; `eta` is in
+    seconds, or None while the rate isn't known yet.
+    """
+    __slots__ = ()
+
+    @property
+    def percent(self):
+        if not self.total_bytes:
+            return 100 if self.files_done >= self.total_files else 0
+        return min(100, self.done_bytes * 100 // self.total_bytes)
+
+def _plain_size(job):
+    try:
+        return crypto.plaintext_size(job.size)
+    except ValueError:
+        return 0
+
+class Progress:
+    """
+    Byte and file counters for one batch, fed by the workers and reported to
+    `on_progress(ProgressInfo)`. Totals can grow while the batch runs, for
+    batches that are discovered as they go (see tree.decrypt_tree).
+    """
+
+    def __init__(self, on_progress=None, interval=PROGRESS_INTERVAL):
+        self.on_progress = on_progress
+        self.interval = interval
+        self.done_bytes = 0
+        self.total_bytes = 0
+        self.files_done = 0
+        self.total_files = 0
+        self._lock = threading.Lock()
+        self._job_bytes = {}        # id(job) -> plaintext bytes written so far
+        self._samples = deque()     # (time, done_bytes) over the last RATE_WINDOW
+        self._last_report = None
+
+    def add_jobs(self, jobs):
+        """Add scheduler.FileJobs to the totals."""
+        total = sum(_plain_size(job) for job in jobs)
+        with self._lock:
+            self.total_bytes += total
+            self.total_files += len(jobs)
+
+    def add_total(self, total_bytes, total_files=0):
+        with self._lock:
+            self.total_bytes += total_bytes
+            self.total_files += total_files
+
+    def add_bytes(self, count, job=None):
+        """`count` plaintext bytes were written, for `job` if given. Safe to call from any thread."""
+        with self._lock:
+            self.done_bytes += count
+            if job is not None:
+                self._job_bytes[id(job)] = self._job_bytes.get(id(job), 0) + count
+
+    def bytes_callback(self, job):
+        """Function for crypto's `on_bytes` argument that counts towards `job`."""
+        return lambda count: self.add_bytes(count, job)
+
+    def file_done(self, job=None):
+        """
+        A file finished, successfully or not. A failed file's unwritten bytes
+        are counted as done too, so the total is still reached at the end.
+        """
+        with self._lock:
+            self.files_done += 1
+            if job is not None:
+                written = self._job_bytes.pop(id(job), 0)
+                self.done_bytes += max(_plain_size(job) - written, 0)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            done, total = self.done_bytes, self.total_bytes
+            files_done, total_files = self.files_done, self.total_files
+        samples = self._samples
+        samples.append((now, done))
+        while len(samples) > 2 and now - samples[1][0] >= RATE_WINDOW:
+            samples.popleft()
+        start, start_done = samples[0]
+        rate = (done - start_done) / (now - start) if now > start else 0.0
+        eta = max(total - done, 0) / rate if rate > 0 else None
+        return ProgressInfo(done, total, files_done, total_files, rate, eta)
+
+    def report(self, force=False):
+        """Call on_progress, unless the last call was less than `interval` ago and not `force`."""
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_report is not None and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        self.on_progress(self.snapshot())
+
+def format_progress(info):
+    """Short human-readable form of a ProgressInfo, e.g. for a status line."""
+    text = f"{info.done_bytes / 1e6:.1f} of {info.total_bytes / 1e6:.1f} MB, {info.rate / 1e6:.1f} MB/s"
+    if info.eta is not None:
+        minutes, seconds = divmod(int(info.eta + 0.5), 60)
+        hours, minutes = divmod(minutes, 60)
+        text += f", {hours}:{minutes:02d}:{seconds:02d} left" if hours else f", {minutes}:{seconds:02d} left"
+    return text
@@ -0,0 +1,303 @@
+"""
+Command-line interface for ReDexter.
+
+    python -m redexter decrypt --dest out/ 'backup/**/*.bin'
+    python -m redexter verify -r backup/
+    python -m redexter cat < file.bin > file
+
+The crypt password and salt are taken from the REDEXTER_PASSWORD and
+REDEXTER_SALT environment variables, from --password-file, or from a crypt
+remote of an rclone config (--config and --remote). This module never imports
+PyQt, and heavier modules are only imported by the command that needs them.
+"""
+import argparse
+import os
+import sys
+
+PASSWORD_ENV = "REDEXTER_PASSWORD"
+SALT_ENV = "REDEXTER_SALT"
+# Same variable rclone itself reads the config password from.
+CONFIG_PASSWORD_ENV = "RCLONE_CONFIG_PASS"
+
+def _read_secret_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.readline().rstrip("\r\n")
+
+def _config_password(args):
+    if args.config_password_file:
+        return _read_secret_file(args.config_password_file)
+    if CONFIG_PASSWORD_ENV in os.environ:
+        return os.environ[CONFIG_PASSWORD_ENV]
+    try:
+        from config_storage import get_config_password
+        return get_config_password(args.config) or ""
+    except Exception:
+        # No keyring backend; treat the config as unencrypted.
+        return ""
+
+def _remote_secrets(args):
+    from config_utils import load_crypt_remotes
+    _, remotes = load_crypt_remotes(args.config, _config_password(args))
+    if args.remote not in remotes:
+        names = ", ".join(sorted(remotes)) or "none"
+        raise ValueError(f"No crypt remote named {args.remote!r} in {args.config} (found: {names}).")
+    return remotes[args.remote]
+
+def load_key_material(args):
+    """Derive the 80 bytes of key material from the key source given on the command line."""
+    import contextlib
+    # Keyring problems are reported with print(); stdout carries the output.
+    with contextlib.redirect_stdout(sys.stderr):
+        return _derive_key_material(args)
+
+def load_key(args):
+    """Derive the data key from the key source given on the command line."""
+    from crypto import DATA_KEY_SIZE
+    return load_key_material(args)[:DATA_KEY_SIZE]
+
+def _derive_key_material(args):
+    from keycache import derive_key_material as derive_key
+    if getattr(args, "config", None):
+        if not args.remote:
+            raise ValueError("--config needs --remote.")
+        password, salt = _remote_secrets(args)
+        return derive_key(password, salt or None, args.remember_key)
+    if args.password_file:
+        password = _read_secret_file(args.password_file)
+    else:
+        password = os.environ.get(PASSWORD_ENV, "")
+    if not password:
+        raise ValueError(f"No password given; set {PASSWORD_ENV} or use --password-file.")
+    if args.salt_file:
+        salt = _read_secret_file(args.salt_file)
+    else:
+        salt = os.environ.get(SALT_ENV, "")
+    return derive_key(password, salt or None, args.remember_key)
+
+def cmd_cat(args):
+    """Decrypt a crypt stream from stdin to stdout."""
+    from crypto import decrypt_stream
+    data_key = load_key(args)
+    out = sys.stdout.buffer
+    for chunk in decrypt_stream(sys.stdin.buffer, data_key, args.read_size):
+        out.write(chunk)
+    out.flush()
+    return 0
+
+def expand_inputs(patterns, recursive=False):
+    """
+    Turn the command-line inputs into a list of paths. Directories contribute
+    the regular files directly inside them, or are kept as they are with
+    `recursive` (for tree mode); anything else is a glob pattern, and a
+    pattern that matches nothing is kept as is so it fails as missing.
+    """
+    import glob
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                matches = [pattern]
+            else:
+                with os.scandir(pattern) as it:
+                    matches = sorted(entry.path for entry in it if entry.is_file())
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+            if not recursive:
+                matches = [path for path in matches if not os.path.isdir(path)]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+def _emit(out, record):
+    import json
+    out.write(json.dumps(record) + "\n")
+    out.flush()
+
+def cmd_decrypt(args):
+    """
+    Decrypt files to disk. Writes one JSON object per file to stdout, then a
+    summary object; diagnostics go to stderr. Exits non-zero if any file failed.
+    """
+    import contextlib
+    from scheduler import decrypt_batch
+    from tree import decrypt_tree
+
+    out = sys.stdout
+    files = expand_inputs(args.inputs, args.recursive)
+    if not files:
+        raise ValueError("No input files.")
+    from crypto import DATA_KEY_SIZE
+    key_material = load_key_material(args)
+    data_key = key_material[:DATA_KEY_SIZE]
+    names = None
+    if args.decrypt_names:
+        from names import NameDecryptor
+        names = NameDecryptor(key_material, encoding=args.name_encoding)
+    counts = {"ok": 0, "failed": 0}
+    manifest = None
+    if args.incremental or args.manifest:
+        from manifest import Manifest, default_manifest_path
+        manifest = Manifest(args.manifest or default_manifest_path(args.dest))
+        counts["skipped"] = 0
+
+    def on_result(job):
+        status = "failed" if job.error else "skipped" if job.skipped else "ok"
+        counts[status] += 1
+        _emit(out, {"file": job.path, "output": job.output_file, "status": status,
+                    "error": job.error.reason if job.error else None})
+
+    def on_progress(info):
+        _emit(out, {"progress": True, "bytes": info.done_bytes, "total_bytes": info.total_bytes,
+                    "files": info.files_done, "total_files": info.total_files,
+                    "rate": round(info.rate), "eta": None if info.eta is None else round(info.eta, 1)})
+
+    # The engine reports problems with print(); keep them off the JSON stream.
+    found = None
+    options = dict(keep_going=args.keep_going, names=names, preallocate=True,
+                   read_size=args.read_size, io_policy=args.io_policy, resume=args.resume,
+                   on_progress=on_progress if args.progress else None, manifest=manifest)
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if args.recursive:
+                found = decrypt_tree(files, data_key, args.dest, args.workers, on_result, **options)
+            else:
+                found = len(decrypt_batch(files, data_key, args.dest, args.workers, on_result, **options))
+        except Exception as e:
+            # Without --keep-going the first failure stops the batch.
+            path = getattr(e, "path", None)
+            if path is None:
+                raise
+            counts["failed"] += 1
+            _emit(out, {"file": path, "output": None, "status": "failed",
+                        "error": getattr(e, "reason", "") or str(e)})
+        finally:
+            if manifest is not None:
+                manifest.close()
+    if found is None:
+        # A tree walk that stopped early never found the rest of its files.
+        found = sum(counts.values()) if args.recursive else len(files)
+    _emit(out, {"summary": True, "files": found, **counts})
+    return 1 if counts["failed"] or counts["ok"] + counts.get("skipped", 0) < found else 0
+
+def cmd_verify(args):
+    """
+    Check that files authenticate, writing nothing. Writes one JSON object per
+    file to stdout, then a summary object. Exits non-zero if any file failed.
+    """
+    import contextlib
+    from scheduler import verify_batch
+
+    out = sys.stdout
+    files = expand_inputs(args.inputs, args.recursive)
+    if not files:
+        raise ValueError("No input files.")
+    if args.recursive:
+        from tree import input_entries
+        files = (path for path, _, _, _ in input_entries(files))
+    data_key = load_key(args)
+    counts = {"ok": 0, "failed": 0}
+
+    def on_result(job):
+        status = "failed" if job.error else "ok"
+        counts[status] += 1
+        _emit(out, {"file": job.path, "status": status, "bad_block": job.bad_block,
+                    "error": job.error.reason if job.error else None})
+
+    def on_progress(info):
+        _emit(out, {"progress": True, "bytes": info.done_bytes, "total_bytes": info.total_bytes,
+                    "files": info.files_done, "total_files": info.total_files,
+                    "rate": round(info.rate), "eta": None if info.eta is None else round(info.eta, 1)})
+
+    with contextlib.redirect_stdout(sys.stderr):
+        checked = verify_batch(files, data_key, args.workers, on_result,
+                               on_progress=on_progress if args.progress else None,
+                               read_size=args.read_size, io_policy=args.io_policy)
+    _emit(out, {"summary": True, "files": checked, **counts})
+    return 1 if counts["failed"] else 0
+
+def _add_key_options(parser):
+    group = parser.add_argument_group("key source")
+    group.add_argument("--password-file", help=f"file holding the crypt password (default: ${PASSWORD_ENV})")
+    group.add_argument("--salt-file", help=f"file holding the crypt salt (default: ${SALT_ENV})")
+    group.add_argument("--config", help="rclone config file to take the crypt password and salt from")
+    group.add_argument("--remote", help="name of the crypt remote in --config")
+    group.add_argument("--config-password-file",
+                       help=f"file holding the config password (default: ${CONFIG_PASSWORD_ENV}, then the keyring)")
+    group.add_argument("--remember-key", action="store_true",
+                       help="keep the derived key in the OS keyring so later runs skip scrypt")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="redexter", description="Decrypt files encrypted by rclone crypt.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Mirrors crypto.IO_POLICIES without importing crypto just to build --help.
+    io_policies = ("default", "sequential", "nocache", "direct")
+    decrypt = subparsers.add_parser("decrypt", help="decrypt files to disk")
+    decrypt.add_argument("inputs", nargs="+", metavar="INPUT",
+                         help="crypt files, directories or glob patterns")
+    decrypt.add_argument("-d", "--dest", help="output directory (default: next to each input)")
+    decrypt.add_argument("-r", "--recursive", action="store_true",
+                         help="walk directories and recreate their structure under --dest")
+    decrypt.add_argument("-j", "--workers", type=int, default=min(os.cpu_count() or 1, 4),
+                         help="worker threads (default: %(default)s)")
+    decrypt.add_argument("--read-size", type=int, default=4 * 1024 * 1024,
+                         help="ciphertext bytes per read (default: 4 MiB)")
+    decrypt.add_argument("--io-policy", choices=io_policies, default="default",
+                         help="page-cache policy (default: %(default)s)")
+    decrypt.add_argument("-k", "--keep-going", action="store_true",
+                         help="carry on with the other files after a failure")
+    decrypt.add_argument("--resume", action="store_true",
+                         help="journal each output and continue interrupted ones instead of starting over")
+    decrypt.add_argument("-i", "--incremental", action="store_true",
+                         help="skip files whose outputs are up to date since the last run")
+    decrypt.add_argument("--manifest",
+                         help="manifest database for --incremental (default: in --dest, else ~/.redexter)")
+    decrypt.add_argument("--progress", action="store_true",
+                         help="also write progress lines (bytes, rate, ETA) about every 100 ms")
+    decrypt.add_argument("-n", "--decrypt-names", action="store_true",
+                         help="name outputs after their decrypted file names (filename_encryption = standard)")
+    decrypt.add_argument("--name-encoding", choices=("base32", "base64", "base32768"), default="base32",
+                         help="the remote's filename_encoding (default: %(default)s)")
+    _add_key_options(decrypt)
+    decrypt.set_defaults(func=cmd_decrypt)
+
+    verify = subparsers.add_parser("verify", help="check files authenticate without writing anything")
+    verify.add_argument("inputs", nargs="+", metavar="INPUT",
+                        help="crypt files, directories or glob patterns")
+    verify.add_argument("-r", "--recursive", action="store_true",
+                        help="walk directories in full")
+    verify.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker threads (default: %(default)s)")
+    verify.add_argument("--read-size", type=int, default=4 * 1024 * 1024,
+                        help="ciphertext bytes per read (default: 4 MiB)")
+    verify.add_argument("--io-policy", choices=io_policies, default="default",
+                        help="page-cache policy (default: %(default)s)")
+    verify.add_argument("--progress", action="store_true",
+                        help="also write progress lines (bytes, rate, ETA) about every 100 ms")
+    _add_key_options(verify)
+    verify.set_defaults(func=cmd_verify)
+
+    cat = subparsers.add_parser("cat", help="decrypt stdin to stdout")
+    cat.add_argument("--read-size", type=int, default=4 * 1024 * 1024,
+                     help="bytes read from stdin at a time (default: 4 MiB)")
+    _add_key_options(cat)
+    cat.set_defaults(func=cmd_cat)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        # Running decryptions stop at their next chunk and remove partial outputs.
+        print("redexter: interrupted", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"redexter: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,533 @@
+"""
+Batch scheduling for decrypting many crypt files on a fixed number of workers.
+
+Files are sized up front and turned into tasks: the largest files are split
+into block-range tasks and started first, mid-sized files run as one task each,
+and tiny files are grouped into batched tasks to amortise per-task overhead.
+"""
+import os
+import shutil
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import crypto
+from progress import Progress
+
+# Files whose ciphertext is larger than this are split into block-range tasks.
+SPLIT_THRESHOLD = 64 * 1024 * 1024
+# Blocks per block-range task (256 blocks = 16 MiB of plaintext).
+RANGE_TASK_BLOCKS = 256
+# Files smaller than this are grouped into batched tasks.
+SMALL_FILE_THRESHOLD = 1024 * 1024
+# Upper bounds for a single batched task.
+BATCH_MAX_BYTES = 8 * 1024 * 1024
+BATCH_MAX_FILES = 256
+# How long the runner waits for a task before yielding control to the caller.
+POLL_INTERVAL = 0.1
+# Files stat'ed and planned at a time by verify_batch, so huge batches stream.
+VERIFY_WINDOW = 4096
+
+class DecryptionError(Exception):
+    """Raised when a file in a batch fails to decrypt."""
+
+    def __init__(self, path, reason=""):
+        super().__init__(f"Decryption failed for {path}" + (f": {reason}" if reason else ""))
+        self.path = path
+        self.reason = reason
+
+class InsufficientSpaceError(Exception):
+    """Raised before a batch starts when a destination cannot hold its outputs."""
+
+    def __init__(self, directory, needed, available):
+        super().__init__(
+            f"Not enough free space in {directory}: "
+            f"{needed / 1e6:.1f} MB needed, {available / 1e6:.1f} MB available."
+        )
+        self.directory = directory
+        self.needed = needed
+        self.available = available
+
+class FileJob:
+    """One input file of a batch, with its ciphertext size and output path."""
+
+    def __init__(self, path, size, dest_dir=None, output_file=None):
+        self.path = path
+        self.size = size
+        self.dest_dir = dest_dir
+        self.output_file = output_file or crypto.output_path_for(path, dest_dir)
+        self.error = None
+        # Set when an incremental run finds the output already up to date (see manifest.py).
+        self.skipped = False
+        # Index of the first block that failed authentication, in verify mode.
+        self.bad_block = None
+        # Only used when the file is split into block ranges.
+        self.ranges_left = 0
+        self.nonce = None
+        self.plain_size = None
+        self.direct = False
+        self.verify_only = False
+        # Set once open_for_ranges has created the output.
+        self.output_opened = False
+        self._infile = None
+        self._outfile = None
+
+    def open_for_ranges(self, io_policy=crypto.IO_POLICY_DEFAULT, verify=False):
+        """
+        Read the header and size the output so block ranges can be written in
+        any order. With `verify` only the input is opened.
+        """
+        self._infile = open(self.path, 'rb')
+        try:
+            self.nonce = crypto.read_header(self._infile)
+            if verify:
+                self.verify_only = True
+                return
+            self.plain_size = crypto.plaintext_size(self.size)
+            self._outfile = open(self.output_file, 'wb')
+            self.output_opened = True
+            crypto.preallocate_output(self._outfile.fileno(), self.plain_size)
+            if io_policy == crypto.IO_POLICY_DIRECT:
+                self.direct = crypto.enable_direct_output(self._outfile.fileno())
+        except Exception:
+            self.close()
+            raise
+
+    def decrypt_range(self, data_key, start, stop, read_size=crypto.DEFAULT_READ_SIZE,
+                      io_policy=crypto.IO_POLICY_DEFAULT, on_bytes=None, cancel=None):
+        crypto.decrypt_block_range(self._infile.fileno(), self._outfile.fileno(),
+                                   data_key, self.nonce, start, stop, read_size,
+                                   io_policy, self.direct, on_bytes, cancel)
+
+    def verify_range(self, data_key, start, stop, read_size=crypto.DEFAULT_READ_SIZE,
+                     io_policy=crypto.IO_POLICY_DEFAULT, on_bytes=None, cancel=None):
+        return crypto.verify_block_range(self._infile.fileno(), data_key, self.nonce, start, stop,
+                                         read_size, io_policy, on_bytes, cancel)
+
+    def note_bad_block(self, block):
+        """Record a block that failed verification; the file's error names the first one."""
+        if self.bad_block is None or block < self.bad_block:
+            self.bad_block = block
+            self.error = DecryptionError(self.path, f"Block {block} failed authentication.")
+
+    def output_dir(self):
+        return self.dest_dir or os.path.dirname(os.path.abspath(self.path))
+
+    def close(self):
+        if self.direct and self._outfile is not None:
+            # Direct writes pad the tail; cut the file back to its real size.
+            os.ftruncate(self._outfile.fileno(), self.plain_size)
+        for f in (self._infile, self._outfile):
+            if f is not None:
+                f.close()
+        self._infile = None
+        self._outfile = None
+
+class RangeTask:
+    """Decrypts blocks [start, stop) of a large file."""
+
+    def __init__(self, job, start, stop):
+        self.job = job
+        self.start = start
+        self.stop = stop
+        self.size = (stop - start) * crypto.BLOCK_SIZE
+
+    def run(self, data_key, progress=None, **decrypt_options):
+        """Returns the first bad block of the range in verify mode, None otherwise."""
+        on_bytes = progress.bytes_callback(self.job) if progress is not None else None
+        try:
+            if decrypt_options.get("verify"):
+                return self.job.verify_range(data_key, self.start, self.stop,
+                                             decrypt_options.get("read_size", crypto.DEFAULT_READ_SIZE),
+                                             decrypt_options.get("io_policy", crypto.IO_POLICY_DEFAULT),
+                                             on_bytes, decrypt_options.get("cancel"))
+            self.job.decrypt_range(data_key, self.start, self.stop,
+                                   decrypt_options.get("read_size", crypto.DEFAULT_READ_SIZE),
+                                   decrypt_options.get("io_policy", crypto.IO_POLICY_DEFAULT),
+                                   on_bytes, decrypt_options.get("cancel"))
+        except crypto.DecryptionCancelled:
+            raise
+        except Exception as e:
+            raise DecryptionError(self.job.path, str(e)) from e
+
+class BatchTask:
+    """Decrypts one or more whole files one after another."""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.size = sum(job.size for job in jobs)
+
+    def run(self, data_key, keep_going=False, progress=None, **decrypt_options):
+        """
+        Returns the jobs that failed. Without `keep_going` the first failure is
+        raised instead and the rest of the batch is skipped. Written bytes are
+        counted in `progress`, a progress.Progress, if given. With the
+        `verify` option files are only checked (see crypto.verify_file).
+        """
+        failed = []
+        verify = decrypt_options.pop("verify", False)
+        for job in self.jobs:
+            if progress is not None:
+                decrypt_options["on_bytes"] = progress.bytes_callback(job)
+            bad_block = None
+            try:
+                if verify:
+                    bad_block = crypto.verify_file(job.path, data_key, **decrypt_options)
+                else:
+                    crypto.decrypt_to(job.path, job.output_file, data_key, **decrypt_options)
+            except crypto.DecryptionCancelled:
+                raise
+            except Exception as e:
+                job.error = DecryptionError(job.path, str(e))
+                if not keep_going:
+                    raise job.error from e
+                failed.append(job)
+                continue
+            if bad_block is not None:
+                job.note_bad_block(bad_block)
+                if not keep_going:
+                    raise job.error
+                failed.append(job)
+        return failed
+
+def _safe_name(name):
+    return name and name not in (".", "..") and "/" not in name and os.sep not in name and "\0" not in name
+
+def scan_jobs(files, dest_dir=None, names=None):
+    """
+    Stat every input up front. Unreadable files get size 0 and fail when run.
+    With a names.NameDecryptor the outputs are named after the decrypted file
+    names; inputs whose names don't decrypt keep the default output path.
+    """
+    jobs = []
+    for path in files:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        jobs.append(FileJob(path, size, dest_dir))
+    if names is not None:
+        plain_names = names.decrypt_paths([os.path.basename(job.path) for job in jobs])
+        for job, name in zip(jobs, plain_names):
+            if _safe_name(name):
+                job.output_file = os.path.join(job.output_dir(), name)
+    return jobs
+
+def _output_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+class OutputNames:
+    """
+    The output paths handed out so far in a batch. Two inputs can map to the
+    same output, e.g. x.bin from two folders decrypted into one destination,
+    and tasks for both would then write into the same file at once. The later
+    one is renamed to "x (2)", "x (3)" and so on instead.
+    """
+
+    def __init__(self):
+        self._taken = set()
+
+    def claim_path(self, path):
+        """Return `path`, or the first free renamed variant of it, and mark it as taken."""
+        candidate = path
+        n = 1
+        while _output_key(candidate) in self._taken:
+            n += 1
+            root, ext = os.path.splitext(path)
+            candidate = f"{root} ({n}){ext}"
+        if candidate != path:
+            print(f"Output {path} is already used in this batch, writing {candidate} instead.")
+        self._taken.add(_output_key(candidate))
+        return candidate
+
+    def claim(self, jobs):
+        """Give each of `jobs` an output no earlier job of the batch has."""
+        for job in jobs:
+            job.output_file = self.claim_path(job.output_file)
+
+def prepare_output_dirs(jobs):
+    """Create each distinct destination directory of a batch once, before any task runs."""
+    for directory in {job.dest_dir for job in jobs if job.dest_dir}:
+        os.makedirs(directory, exist_ok=True)
+
+def _existing_dir(path):
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+class SpaceBudget:
+    """
+    Tracks the free space of each destination filesystem as jobs are added,
+    for batches that are discovered bit by bit. Free space is measured the
+    first time a filesystem is seen, and every job added is charged against it,
+    less the size of any output it would replace.
+    """
+
+    def __init__(self):
+        self._devices = {}  # st_dev -> [needed, available, directory]
+
+    def add(self, jobs):
+        """Charge `jobs`. Raises InsufficientSpaceError naming the first filesystem that can't hold them."""
+        for job in jobs:
+            try:
+                size = crypto.plaintext_size(job.size)
+            except ValueError:
+                continue
+            directory = _existing_dir(os.path.dirname(os.path.abspath(job.output_file)))
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                continue
+            usage = self._devices.get(device)
+            if usage is None:
+                usage = self._devices[device] = [0, shutil.disk_usage(directory).free, directory]
+            try:
+                # An existing output is overwritten or resumed, so its space counts as free.
+                size = max(size - os.path.getsize(job.output_file), 0)
+            except OSError:
+                pass
+            usage[0] += size
+        for needed, available, directory in self._devices.values():
+            if needed > available:
+                raise InsufficientSpaceError(directory, needed, available)
+
+def check_free_space(jobs):
+    """
+    Make sure every destination filesystem can hold the whole batch before any
+    output is written. Raises InsufficientSpaceError naming the first one that can't.
+    """
+    SpaceBudget().add(jobs)
+
+def plan_tasks(jobs, workers=1, split=True):
+    """
+    Order a batch for a fixed worker count: largest files first, large files
+    split into block ranges (unless `split` is false, e.g. for resume mode,
+    which writes each file in order), tiny files grouped into batches at the end.
+    """
+    split = split and workers > 1 and crypto.can_decrypt_parallel()
+    range_tasks = []
+    file_tasks = []
+    small_jobs = []
+    for job in sorted(jobs, key=lambda j: j.size, reverse=True):
+        if split and job.size > SPLIT_THRESHOLD:
+            try:
+                num_blocks = crypto.block_count(job.size)
+            except ValueError:
+                file_tasks.append(BatchTask([job]))
+                continue
+            for start in range(0, num_blocks, RANGE_TASK_BLOCKS):
+                range_tasks.append(RangeTask(job, start, min(start + RANGE_TASK_BLOCKS, num_blocks)))
+            job.ranges_left = (num_blocks + RANGE_TASK_BLOCKS - 1) // RANGE_TASK_BLOCKS
+        elif job.size >= SMALL_FILE_THRESHOLD:
+            file_tasks.append(BatchTask([job]))
+        else:
+            small_jobs.append(job)
+
+    batch_tasks = []
+    batch = []
+    batch_bytes = 0
+    for job in small_jobs:
+        batch.append(job)
+        batch_bytes += job.size
+        if len(batch) >= BATCH_MAX_FILES or batch_bytes >= BATCH_MAX_BYTES:
+            batch_tasks.append(BatchTask(batch))
+            batch = []
+            batch_bytes = 0
+    if batch:
+        batch_tasks.append(BatchTask(batch))
+    return range_tasks + file_tasks + batch_tasks
+
+def run_tasks(tasks, data_key, workers=1, on_result=None, keep_going=False, progress=None,
+              cancel=None, **decrypt_options):
+    """
+    Run planned tasks on a pool of `workers` threads, keeping only a small
+    window of them queued. Yields the number of files finished since the last
+    yield, and also yields 0 every POLL_INTERVAL so callers can stop early by
+    closing the generator. Raises DecryptionError on the first failure, unless
+    `keep_going` is set, in which case failed files are counted as finished and
+    the rest of the batch still runs.
+    `on_result(job)` is called from the caller's thread as each file finishes;
+    `job.error` is the DecryptionError for a failed file and None otherwise.
+    `progress` is a progress.Progress that counts the bytes written; its
+    callback is also run from the caller's thread, at most once per interval.
+    `decrypt_options` are passed on to crypto.decrypt_to for whole-file tasks.
+
+    Setting the threading.Event `cancel` stops the batch within about
+    POLL_INTERVAL plus one chunk and raises crypto.DecryptionCancelled.
+    Whenever the runner stops early (cancelled, failed or closed), the running
+    tasks are stopped at their next chunk and outputs that were only partly
+    written are removed.
+    """
+    workers = max(1, workers)
+    pending = {}
+    opened = []
+    remaining = iter(tasks)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    # Tasks watch this event; it is set on the way out so they stop promptly.
+    stop = threading.Event()
+    decrypt_options["cancel"] = stop
+
+    def finish_range(job):
+        # Returns 1 once the last range of a split file is accounted for.
+        job.ranges_left -= 1
+        if job.ranges_left:
+            return 0
+        job.close()
+        if job.error is not None and job.output_opened:
+            # The output was preallocated at full size; don't leave it looking complete.
+            crypto.remove_partial(job.output_file)
+        if job.error is not None and not keep_going:
+            raise job.error
+        if progress is not None:
+            progress.file_done(job)
+        if on_result:
+            on_result(job)
+        return 1
+
+    try:
+        while True:
+            crypto.check_cancelled(cancel)
+            files_done = 0
+            while len(pending) < workers * 2:
+                task = next(remaining, None)
+                if task is None:
+                    break
+                if isinstance(task, RangeTask):
+                    job = task.job
+                    if job.nonce is None and job.error is None:
+                        try:
+                            job.open_for_ranges(
+                                decrypt_options.get("io_policy", crypto.IO_POLICY_DEFAULT),
+                                decrypt_options.get("verify", False))
+                            opened.append(job)
+                        except Exception as e:
+                            job.error = DecryptionError(job.path, str(e))
+                    if job.error is not None:
+                        # Don't bother with the other ranges of a file that already failed.
+                        files_done += finish_range(job)
+                        continue
+                    pending[pool.submit(task.run, data_key, progress, **decrypt_options)] = task
+                else:
+                    pending[pool.submit(task.run, data_key, keep_going, progress,
+                                        **decrypt_options)] = task
+            if not pending:
+                if progress is not None:
+                    progress.report(force=True)
+                if files_done:
+                    yield files_done
+                break
+            done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                if isinstance(task, RangeTask):
+                    try:
+                        bad_block = future.result()
+                    except DecryptionError as e:
+                        if task.job.error is None:
+                            task.job.error = e
+                    else:
+                        if bad_block is not None:
+                            task.job.note_bad_block(bad_block)
+                    files_done += finish_range(task.job)
+                else:
+                    future.result()
+                    for job in task.jobs:
+                        if progress is not None:
+                            progress.file_done(job)
+                        if on_result:
+                            on_result(job)
+                    files_done += len(task.jobs)
+            if progress is not None:
+                progress.report()
+            yield files_done
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        for job in opened:
+            job.close()
+            if job.ranges_left and job.output_opened:
+                # Split files that were stopped part-way.
+                crypto.remove_partial(job.output_file)
+
+def decrypt_batch(files, data_key, dest_dir=None, workers=1, on_result=None,
+                  keep_going=False, names=None, on_progress=None, cancel=None,
+                  manifest=None, **decrypt_options):
+    """
+    Decrypt a list of files with size-aware scheduling. Inputs that would
+    share an output are given distinct ones (see OutputNames). Raises
+    InsufficientSpaceError before starting if the outputs won't fit, and
+    DecryptionError on the first failure unless `keep_going` is set.
+    Returns the list of FileJobs; see run_tasks for `on_result` and
+    scan_jobs for `names`. `on_progress(info)` receives a progress.ProgressInfo
+    about every PROGRESS_INTERVAL, measured against the total plaintext size.
+    Setting the threading.Event `cancel` stops the batch (see run_tasks).
+    With `resume=True` (passed on to crypto.decrypt_to) interrupted outputs
+    are continued from their journal instead of starting over.
+    With a manifest.Manifest, files whose outputs are up to date are skipped
+    (passed to `on_result` with `job.skipped` set) and the others are
+    recorded in it as they succeed.
+    """
+    jobs = scan_jobs(files, dest_dir, names)
+    OutputNames().claim(jobs)
+    todo = jobs
+    if manifest is not None:
+        todo = manifest.select(jobs)
+        if on_result:
+            for job in jobs:
+                if job.skipped:
+                    on_result(job)
+        on_result = manifest.recorder(on_result)
+    check_free_space(todo)
+    prepare_output_dirs(todo)
+    progress = None
+    if on_progress is not None:
+        progress = Progress(on_progress)
+        progress.add_jobs(todo)
+    tasks = plan_tasks(todo, workers, split=not decrypt_options.get("resume"))
+    try:
+        for _ in run_tasks(tasks, data_key, workers, on_result, keep_going, progress, cancel,
+                           **decrypt_options):
+            pass
+    finally:
+        if manifest is not None:
+            manifest.commit()
+    return jobs
+
+def verify_batch(files, data_key, workers=1, on_result=None, keep_going=True,
+                 on_progress=None, cancel=None, read_size=crypto.DEFAULT_READ_SIZE,
+                 io_policy=crypto.IO_POLICY_DEFAULT):
+    """
+    Check that every file authenticates under `data_key`, without writing
+    anything. Files are planned like a decryption batch, so large files are
+    checked as block ranges on all workers, but `files` is consumed
+    VERIFY_WINDOW at a time and may be any iterable of paths.
+    `on_result(job)` gets each FileJob as it finishes; a bad file has
+    `job.bad_block` set to the index of its first bad block and `job.error`
+    describing it. Unless `keep_going` is false, all files are checked and
+    the failures only reported. See decrypt_batch for `on_progress` and
+    `cancel`. Returns the number of files checked.
+    """
+    checked = 0
+    progress = Progress(on_progress) if on_progress is not None else None
+
+    def tasks():
+        nonlocal checked
+        paths = iter(files)
+        while True:
+            window = list(itertools.islice(paths, VERIFY_WINDOW))
+            if not window:
+                return
+            jobs = scan_jobs(window)
+            checked += len(jobs)
+            if progress is not None:
+                progress.add_jobs(jobs)
+            yield from plan_tasks(jobs, workers)
+
+    for _ in run_tasks(tasks(), data_key, workers, on_result, keep_going, progress, cancel,
+                       verify=True, read_size=read_size, io_policy=io_policy):
+        pass
+    return checked
@@ -0,0 +1,199 @@
+"""
+Round trips and failure handling of the file decryption paths and the batch
+scheduler, on files encrypted here the way rclone does it. Run with
+`python -m unittest` (or pytest) from the repository root.
+"""
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import nacl.bindings
+import nacl.exceptions
+
+import crypto
+import scheduler
+
+KEY = bytes(range(32))
+# Enough blocks to split across workers, with a partial last block.
+PLAIN_SIZE = 40 * crypto.BLOCK_DATA_SIZE + 123
+
+def encrypt(plain, key=KEY, nonce=None):
+    """Encrypt `plain` into the rclone crypt file format."""
+    nonce = nonce or os.urandom(crypto.FILE_NONCE_SIZE)
+    out = bytearray(crypto.FILE_MAGIC + nonce)
+    for offset in range(0, len(plain), crypto.BLOCK_DATA_SIZE):
+        out += nacl.bindings.crypto_secretbox(plain[offset:offset + crypto.BLOCK_DATA_SIZE],
+                                              nonce, key)
+        nonce = crypto.increment_nonce(nonce)
+    return bytes(out)
+
+def corrupt_block(path, block):
+    with open(path, 'r+b') as f:
+        f.seek(crypto.FILE_HEADER_SIZE + block * crypto.BLOCK_SIZE + 100)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 1]))
+
+class FileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def make(self, name, size=PLAIN_SIZE):
+        """Write an encrypted file of `size` random bytes; returns (path, plaintext)."""
+        path = os.path.join(self.dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        plain = os.urandom(size)
+        with open(path, 'wb') as f:
+            f.write(encrypt(plain))
+        return path, plain
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+# Each mode of crypto.decrypt_to, as keyword arguments.
+DECRYPT_MODES = {
+    "serial": {},
+    "parallel": {"workers": 4},
+    "mmap": {"use_mmap": True},
+    "buffered": {"use_mmap": False, "read_size": crypto.BLOCK_SIZE},
+    "preallocate": {"preallocate": True},
+    "direct": {"io_policy": crypto.IO_POLICY_DIRECT},
+    "direct parallel": {"io_policy": crypto.IO_POLICY_DIRECT, "workers": 4},
+}
+
+class DecryptToTest(FileTestCase):
+
+    def test_round_trip(self):
+        for size in (0, 1, crypto.BLOCK_DATA_SIZE, PLAIN_SIZE):
+            path, plain = self.make(f"{size}.bin", size)
+            for mode, options in DECRYPT_MODES.items():
+                with self.subTest(mode=mode, size=size):
+                    output = os.path.join(self.dir, f"{size}-{mode}")
+                    crypto.decrypt_to(path, output, KEY, **options)
+                    self.assertEqual(self.read(output), plain)
+
+    def test_bad_block_removes_output(self):
+        path, _ = self.make("bad.bin")
+        corrupt_block(path, 30)
+        for mode, options in DECRYPT_MODES.items():
+            with self.subTest(mode=mode):
+                output = os.path.join(self.dir, mode)
+                with self.assertRaises(nacl.exceptions.CryptoError):
+                    crypto.decrypt_to(path, output, KEY, **options)
+                self.assertFalse(os.path.exists(output))
+
+    def test_bad_header_keeps_existing_output(self):
+        path = os.path.join(self.dir, "junk.bin")
+        with open(path, 'wb') as f:
+            f.write(b"not a crypt file")
+        output = os.path.join(self.dir, "junk")
+        with open(output, 'wb') as f:
+            f.write(b"keep me")
+        with self.assertRaises(ValueError):
+            crypto.decrypt_to(path, output, KEY)
+        self.assertEqual(self.read(output), b"keep me")
+
+    def test_wrong_key(self):
+        path, _ = self.make("x.bin")
+        with self.assertRaises(nacl.exceptions.CryptoError):
+            crypto.decrypt_to(path, os.path.join(self.dir, "x"), bytes(32))
+
+    def test_cancel_removes_output(self):
+        path, _ = self.make("x.bin")
+        output = os.path.join(self.dir, "x")
+        cancel = threading.Event()
+        cancel.set()
+        for mode, options in DECRYPT_MODES.items():
+            with self.subTest(mode=mode), self.assertRaises(crypto.DecryptionCancelled):
+                crypto.decrypt_to(path, output, KEY, cancel=cancel, **options)
+            self.assertFalse(os.path.exists(output))
+
+    @mock.patch.object(crypto, "JOURNAL_INTERVAL", crypto.BLOCK_DATA_SIZE)
+    def test_resume_after_cancel(self):
+        path, plain = self.make("x.bin")
+        output = os.path.join(self.dir, "x")
+        cancel = threading.Event()
+        written = []
+
+        def on_bytes(count):
+            written.append(count)
+            if len(written) == 10:
+                cancel.set()
+
+        with self.assertRaises(crypto.DecryptionCancelled):
+            crypto.decrypt_to(path, output, KEY, read_size=crypto.BLOCK_SIZE,
+                              on_bytes=on_bytes, cancel=cancel, resume=True)
+        self.assertTrue(os.path.exists(output))
+
+        written.clear()
+        crypto.decrypt_to(path, output, KEY, read_size=crypto.BLOCK_SIZE,
+                          on_bytes=written.append, resume=True)
+        self.assertEqual(self.read(output), plain)
+        # The second run reports the resumed part at once rather than decrypting it again.
+        self.assertEqual(written[0], 10 * crypto.BLOCK_DATA_SIZE)
+        self.assertFalse(os.path.exists(output + ".redexter-journal"))
+
+class RunTasksTest(FileTestCase):
+
+    def split_tasks(self, job, blocks_per_task=8):
+        # A file split into block ranges, as plan_tasks does for large files.
+        num_blocks = crypto.block_count(job.size)
+        tasks = [scheduler.RangeTask(job, start, min(start + blocks_per_task, num_blocks))
+                 for start in range(0, num_blocks, blocks_per_task)]
+        job.ranges_left = len(tasks)
+        return tasks
+
+    def run_batch(self, tasks, workers=4, keep_going=False, **options):
+        results = []
+        for _ in scheduler.run_tasks(tasks, KEY, workers, results.append, keep_going, **options):
+            pass
+        return results
+
+    def test_split_round_trip(self):
+        path, plain = self.make("x.bin")
+        job = scheduler.scan_jobs([path], os.path.join(self.dir, "out"))[0]
+        scheduler.prepare_output_dirs([job])
+        self.assertEqual(self.run_batch(self.split_tasks(job)), [job])
+        self.assertIsNone(job.error)
+        self.assertEqual(self.read(job.output_file), plain)
+
+    def test_corrupt_split_file(self):
+        path, _ = self.make("bad.bin")
+        corrupt_block(path, 20)
+        for keep_going in (True, False):
+            with self.subTest(keep_going=keep_going):
+                job = scheduler.scan_jobs([path])[0]
+                tasks = self.split_tasks(job)
+                if keep_going:
+                    self.assertEqual(self.run_batch(tasks, keep_going=True), [job])
+                    self.assertIsInstance(job.error, scheduler.DecryptionError)
+                else:
+                    with self.assertRaises(scheduler.DecryptionError):
+                        self.run_batch(tasks)
+                # The preallocated output must not be left behind looking complete.
+                self.assertFalse(os.path.exists(job.output_file))
+
+    def test_colliding_outputs(self):
+        first, first_plain = self.make("a/x.bin")
+        second, second_plain = self.make("b/x.bin", 1000)
+        dest = os.path.join(self.dir, "out")
+        jobs = scheduler.scan_jobs([first, second], dest)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler.OutputNames().claim(jobs)
+        scheduler.prepare_output_dirs(jobs)
+        tasks = self.split_tasks(jobs[0]) + scheduler.plan_tasks(jobs[1:])
+        self.run_batch(tasks, preallocate=True)
+        self.assertEqual(sorted(os.listdir(dest)), ["x", "x (2)"])
+        self.assertEqual(self.read(os.path.join(dest, "x")), first_plain)
+        self.assertEqual(self.read(os.path.join(dest, "x (2)")), second_plain)
+
+if __name__ == "__main__":
+    unittest.main()
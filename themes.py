@@ -87,7 +87,7 @@ QLabel[objectName="iconLabel"] {{
 }}
 
 /* Input Fields */
-QLineEdit, QListWidget {{
+QLineEdit, QListView {{
     background-color: {colors['bg_secondary']};
     border: 1px solid {colors['border']};
     padding: 8px 12px;
@@ -98,7 +98,7 @@ QLineEdit, QListWidget {{
     selection-background-color: {colors['accent']};
 }}
 
-QLineEdit:focus, QListWidget:focus {{
+QLineEdit:focus, QListView:focus {{
     border: 1px solid {colors['accent']};
     outline: none;
 }}
@@ -109,24 +109,24 @@ QLineEdit::placeholder {{
 }}
 
 /* List Widget Items */
-QListWidget::item {{
+QListView::item {{
     padding: 8px 12px;
     border-radius: 6px;
     margin: 2px 0px;
     background-color: transparent;
 }}
 
-QListWidget::item:hover {{
+QListView::item:hover {{
     background-color: {colors['hover']};
 }}
 
-QListWidget::item:selected {{
+QListView::item:selected {{
     background-color: {colors['accent']};
     color: {colors['text_on_accent']};
     font-weight: 500;
 }}
 
-QListWidget::item:selected:hover {{
+QListView::item:selected:hover {{
     background-color: {colors['accent_hover']};
 }}
 
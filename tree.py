@@ -0,0 +1,223 @@
+"""
+Tree mode: decrypt whole directories and recreate their structure.
+
+Inputs are walked with os.scandir. Every file becomes a FileJob whose output
+sits at the same relative path under the destination, so files with the same
+name in different folders no longer collide. Jobs are handed out in windows
+while the walk is still running: the scheduler starts on the first files
+straight away, and each window's output directories are created together
+before its jobs are released.
+"""
+import os
+import time
+
+from scheduler import FileJob, OutputNames, SpaceBudget, plan_tasks, run_tasks
+from progress import Progress
+
+# The first window is small so decryption starts quickly; windows then double
+# up to TREE_WINDOW_MAX jobs.
+TREE_WINDOW_MIN = 16
+TREE_WINDOW_MAX = 1024
+# A window is released after this many seconds even if it isn't full, so a
+# slow walk (e.g. over a network filesystem) doesn't hold back the workers.
+TREE_WINDOW_SECONDS = 0.5
+
+def walk_files(root):
+    """
+    Yield (entry, relative_path) for every regular file under `root`, where
+    entry is the os.DirEntry, top-down and in name order. Symlinked
+    directories are not followed; unreadable directories are skipped.
+    """
+    stack = [(root, "")]
+    while stack:
+        directory, rel_dir = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print("Skipping unreadable directory:", e)
+            continue
+        subdirs = []
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, rel))
+                elif entry.is_file():
+                    yield entry, rel
+            except OSError:
+                continue
+        # Reversed so the stack pops subdirectories in name order.
+        stack.extend(reversed(subdirs))
+
+def make_dirs(directories):
+    """
+    Create a batch of directories in one pass, parents first, skipping the
+    ones that already exist. Empty entries (the current directory) are ignored.
+    Returns the set of directories now known to exist.
+    """
+    directories = {directory for directory in directories if directory}
+    for directory in sorted(directories):
+        try:
+            os.mkdir(directory)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+    return directories
+
+def _output_rel_path(rel, plain_rel):
+    # Output path for a relative input path, given its decrypted form (or None).
+    if plain_rel is not None:
+        parts = plain_rel.split("/")
+        if all(p and p not in (".", "..") and os.sep not in p and "\0" not in p for p in parts):
+            return os.path.join(*parts)
+    directory, _, name = rel.rpartition("/")
+    parts = directory.split("/") if directory else []
+    # Same naming as crypto.output_path_for: drop the last extension.
+    return os.path.join(*parts, os.path.splitext(name)[0])
+
+def _root_name(root, names):
+    name = os.path.basename(os.path.normpath(root))
+    if names is not None:
+        try:
+            return names.decrypt_segment(name)
+        except ValueError:
+            pass
+    return name
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def output_base(root, dest_dir=None, names=None):
+    """
+    Directory that the files of a directory input are recreated in: a folder
+    of the same name (decrypted if possible) below `dest_dir`, or the input
+    directory itself when decrypting in place.
+    """
+    return os.path.join(dest_dir, _root_name(root, names)) if dest_dir else root
+
+def input_entries(inputs, dest_dir=None, names=None):
+    """
+    Walk `inputs` and yield (path, output base directory, relative path, size)
+    for every file found. A file input is decrypted to `dest_dir` (or next to
+    itself); a directory input is mirrored below output_base. A directory
+    given twice is walked once, and directories with the same name get
+    distinct bases (see scheduler.OutputNames).
+    """
+    roots = set()
+    bases = OutputNames()
+    for root in inputs:
+        if os.path.isdir(root):
+            if os.path.abspath(root) in roots:
+                continue
+            roots.add(os.path.abspath(root))
+            base = bases.claim_path(output_base(root, dest_dir, names))
+            for entry, rel in walk_files(root):
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    size = 0
+                yield entry.path, base, rel, size
+        else:
+            # A bare file name has no directory part; its output goes next to it.
+            base = dest_dir or os.path.dirname(root) or os.curdir
+            yield root, base, os.path.basename(root), _size(root)
+
+def job_windows(entries, dest_dir=None, names=None):
+    """
+    Turn (path, base, relative path, size) entries, as from input_entries,
+    into lists of FileJobs. Each output sits at the relative path under its
+    base. `names` is an optional names.NameDecryptor, applied to each window
+    in one batch; paths that don't decrypt keep their encrypted names.
+    Top-level outputs that are already taken, such as two file inputs with
+    the same name, are renamed (see scheduler.OutputNames); deeper ones are
+    unique once their bases are.
+    """
+    pending = []
+    made = set()
+    top_level = OutputNames()
+    limit = TREE_WINDOW_MIN
+    started = time.monotonic()
+
+    def flush():
+        rels = [rel for _, _, rel, _ in pending]
+        plain_rels = names.decrypt_paths(rels) if names is not None else [None] * len(rels)
+        jobs = []
+        for (path, base, rel, size), plain_rel in zip(pending, plain_rels):
+            output_file = os.path.join(base, _output_rel_path(rel, plain_rel))
+            if "/" not in rel:
+                output_file = top_level.claim_path(output_file)
+            jobs.append(FileJob(path, size, dest_dir, output_file))
+        made.update(make_dirs({os.path.dirname(job.output_file) for job in jobs} - made))
+        pending.clear()
+        return jobs
+
+    for entry in entries:
+        pending.append(entry)
+        if len(pending) >= limit or time.monotonic() - started >= TREE_WINDOW_SECONDS:
+            yield flush()
+            limit = min(limit * 2, TREE_WINDOW_MAX)
+            started = time.monotonic()
+    if pending:
+        yield flush()
+
+def iter_job_windows(inputs, dest_dir=None, names=None):
+    """Walk `inputs` and yield lists of FileJobs as the walk goes (see job_windows)."""
+    return job_windows(input_entries(inputs, dest_dir, names), dest_dir, names)
+
+def stream_tasks(job_windows, workers=1, budget=None, on_jobs=None, split=True):
+    """
+    Plan each window of jobs as it arrives (see scheduler.plan_tasks for
+    `split`) and yield its tasks. `budget` is a scheduler.SpaceBudget the jobs are charged
+    to before their tasks are released; `on_jobs(jobs)` is called per window.
+    """
+    for jobs in job_windows:
+        if budget is not None:
+            budget.add(jobs)
+        if on_jobs is not None:
+            on_jobs(jobs)
+        yield from plan_tasks(jobs, workers, split)
+
+def decrypt_tree(inputs, data_key, dest_dir=None, workers=1, on_result=None,
+                 keep_going=False, names=None, on_progress=None, cancel=None, manifest=None,
+                 **decrypt_options):
+    """
+    Decrypt files and whole directory trees, recreating the structure under
+    `dest_dir`. Decryption starts while the walk is still running. Raises
+    InsufficientSpaceError once the files found so far no longer fit, and
+    DecryptionError on the first failure unless `keep_going` is set.
+    See scheduler.run_tasks for `on_result` and scheduler.decrypt_batch for
+    `on_progress`, `cancel`, `resume` and `manifest`; here the totals grow as
+    the walk finds more files.
+    Returns the number of files found.
+    """
+    found = []
+    progress = Progress(on_progress) if on_progress is not None else None
+
+    def count_found(windows):
+        for jobs in windows:
+            found.append(len(jobs))
+            yield jobs
+
+    def on_jobs(jobs):
+        if progress is not None:
+            progress.add_jobs(jobs)
+
+    windows = count_found(iter_job_windows(inputs, dest_dir, names))
+    if manifest is not None:
+        windows = manifest.select_windows(windows, on_result)
+        on_result = manifest.recorder(on_result)
+    tasks = stream_tasks(windows, workers, SpaceBudget(), on_jobs,
+                         split=not decrypt_options.get("resume"))
+    try:
+        for _ in run_tasks(tasks, data_key, workers, on_result, keep_going, progress, cancel,
+                           **decrypt_options):
+            pass
+    finally:
+        if manifest is not None:
+            manifest.commit()
+    return sum(found)
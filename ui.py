@@ -1,53 +1,218 @@
 import os
+import threading
 from typing import Optional, TYPE_CHECKING
 
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QFileDialog, QMessageBox, QComboBox, QInputDialog,
     QProgressDialog, QToolButton, QGroupBox,
-    QFrame, QScrollArea
+    QFrame, QScrollArea, QSpinBox, QCheckBox
 )
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve, QPoint
-from PyQt6.QtGui import QFont, QResizeEvent
+from PyQt6.QtGui import QFont, QResizeEvent, QCloseEvent
 
 import qtawesome as qta
 
 from themes import THEMES, original_dark, DARK_MODE_COLORS, CATPPUCCIN_COLORS, DRACULA_COLORS, TRUE_BLACK_COLORS
-from drag_drop_listwidget import DragDropListWidget
-from crypto import make_key, decrypt_file
-from config_utils import load_rclone_config, get_crypt_remotes
+from drag_drop_listview import DragDropListView
+from crypto import DEFAULT_READ_SIZE, IO_POLICY_DEFAULT, IO_POLICIES, DecryptionCancelled
+from keycache import KEY_CACHE_SIZE, derive_key, forget_key, clear_keys
+from pipeline import run_pipeline
+from progress import Progress, format_progress
+from manifest import Manifest, default_manifest_path
+from scheduler import (
+    DecryptionError, InsufficientSpaceError, FileJob, OutputNames, SpaceBudget, scan_jobs,
+    check_free_space, prepare_output_dirs, plan_tasks, run_tasks
+)
+from tree import iter_job_windows, job_windows, stream_tasks
+from file_list import FileListModel, FileListSnapshot, DirectoryScanner
+from config_utils import load_crypt_remotes, clear_config_cache
 
 if TYPE_CHECKING:
     from typing import cast
 
+class ConfigLoader(QThread):
+    """Loads the last used rclone config off the GUI thread."""
+    loaded = pyqtSignal(str, object, object)    # Emits config path, ConfigParser and crypt remotes
+
+    def run(self):
+        try:
+            import config_storage
+            last_config = config_storage.get_last_config_path()
+            if not last_config:
+                return
+            stored_password = config_storage.get_config_password(last_config)
+            if stored_password is None:
+                stored_password = ""
+            config, crypt_remotes = load_crypt_remotes(last_config, stored_password)
+        except Exception as e:
+            print("Auto-loading last config failed:", e)
+            return
+        self.loaded.emit(last_config, config, crypt_remotes)
+
+class KeyDeriver(QThread):
+    """
+    Derives the data keys of crypt remotes ahead of time, into the in-memory
+    cache only. A cancelled deriver stops before its next key; with `discard`
+    the key it was deriving is dropped as well, e.g. once the config is removed.
+    """
+
+    def __init__(self, secrets):
+        super().__init__()
+        self.secrets = list(secrets)
+        self._stop = threading.Event()
+        self._discard = threading.Event()
+
+    def cancel(self, discard=False):
+        if discard:
+            self._discard.set()
+        self._stop.set()
+
+    def run(self):
+        for password, salt in self.secrets:
+            if self._stop.is_set():
+                return
+            try:
+                derive_key(password, salt or None)
+            except Exception as e:
+                print("Key pre-derivation failed:", e)
+                continue
+            if self._discard.is_set():
+                forget_key(password, salt or None)
+                return
+
 class DecryptionWorker(QThread):
     progress_update = pyqtSignal(int)   # Emits progress percentage
+    progress_info = pyqtSignal(object)  # Emits a progress.ProgressInfo (bytes, MB/s, ETA)
     finished_signal = pyqtSignal(bool)    # Emits True on success
     error_signal = pyqtSignal(str)        # Emits error message
 
-    def __init__(self, files, data_key, dest):
+    def __init__(self, files, data_key, dest, max_workers=1, pipelined=False,
+                 read_size=DEFAULT_READ_SIZE, io_policy=IO_POLICY_DEFAULT, tree_mode=False,
+                 resume=False, incremental=False):
+        """
+        `files` is a list of paths or a file_list.FileListSnapshot of files
+        already scanned. `data_key` is the key itself, or a function returning
+        it that is called on the worker thread. With `tree_mode` folders are
+        walked and their structure recreated under `dest`. With `resume`
+        interrupted outputs are continued from their journals; this always
+        uses the scheduler, without splitting files. With `incremental` files
+        whose outputs are up to date according to the manifest (see
+        manifest.py) are skipped; this also always uses the scheduler.
+        """
         super().__init__()
         self.files = files
         self.data_key = data_key
         self.dest = dest
-        self._is_interrupted = False
+        self.max_workers = max(1, max_workers)
+        self.pipelined = pipelined
+        self.read_size = read_size
+        self.io_policy = io_policy
+        self.tree_mode = tree_mode
+        self.resume = resume
+        self.incremental = incremental
+        # Checked by the decryption engine before every chunk, so cancelling
+        # takes effect mid-file rather than after it.
+        self.cancel_event = threading.Event()
 
     def run(self):
-        total = len(self.files)
-        for index, file in enumerate(self.files):
-            if self._is_interrupted:
-                self.error_signal.emit("Operation cancelled.")
+        # The scheduler sizes the batch up front: large files are split into
+        # block ranges and started first, tiny files are grouped together.
+        # In pipelined mode files are instead streamed in order through
+        # overlapping read / decrypt / write stages. Tree mode always uses the
+        # scheduler, fed window by window while the folders are walked.
+        if callable(self.data_key):
+            try:
+                self.data_key = self.data_key()
+            except Exception as e:
+                self.error_signal.emit(f"Key derivation failed:\n{e}")
                 return
-            result = decrypt_file(file, self.data_key, self.dest)
-            if result != 0:
-                self.error_signal.emit(f"Decryption failed for {file}")
+        # Progress is counted in plaintext bytes and reported at most every
+        # PROGRESS_INTERVAL, so a single huge file still moves the bar and a
+        # batch of many small files doesn't flood the GUI with signals.
+        progress = Progress(self.report_progress)
+        self._percent = 0
+        manifest = None
+        on_result = None
+        if self.incremental:
+            try:
+                manifest = Manifest(default_manifest_path(self.dest))
+            except Exception as e:
+                self.error_signal.emit(f"Could not open the manifest:\n{e}")
                 return
-            percent = int(((index + 1) / total) * 100)
-            self.progress_update.emit(percent)
+            on_result = manifest.recorder()
+        runner = None
+        try:
+            runner = self._runner(progress, manifest, on_result)
+            for _ in runner:
+                pass
+        except DecryptionCancelled:
+            self.error_signal.emit("Operation cancelled.")
+            return
+        except DecryptionError as e:
+            print(e)
+            self.error_signal.emit(f"Decryption failed for {e.path}")
+            return
+        except InsufficientSpaceError as e:
+            self.error_signal.emit(str(e))
+            return
+        except Exception as e:
+            # E.g. an output folder that can't be created. Nothing may escape
+            # QThread.run: PyQt aborts the whole application on it.
+            print("Decryption failed:", e)
+            self.error_signal.emit(str(e))
+            return
+        finally:
+            if runner is not None:
+                runner.close()
+            if manifest is not None:
+                manifest.close()
         self.finished_signal.emit(True)
 
+    def _runner(self, progress, manifest, on_result):
+        # Plan the batch and return its runner generator (see run).
+        if self.tree_mode:
+            # Files are found while decryption runs, so the total keeps growing.
+            if isinstance(self.files, FileListSnapshot):
+                windows = job_windows(self.files.tree_entries(self.dest), self.dest)
+            else:
+                windows = iter_job_windows(self.files, self.dest)
+            if manifest is not None:
+                windows = manifest.select_windows(windows)
+            tasks = stream_tasks(windows, self.max_workers, SpaceBudget(), progress.add_jobs,
+                                 split=not self.resume)
+            return run_tasks(tasks, self.data_key, self.max_workers, on_result, progress=progress,
+                             cancel=self.cancel_event, preallocate=True, read_size=self.read_size,
+                             io_policy=self.io_policy, resume=self.resume)
+        if isinstance(self.files, FileListSnapshot):
+            # Sizes were recorded by the scanner; no need to stat again.
+            jobs = [FileJob(path, size, self.dest)
+                    for path, size in zip(self.files, self.files.sizes())]
+        else:
+            jobs = scan_jobs(self.files, self.dest)
+        OutputNames().claim(jobs)
+        if manifest is not None:
+            jobs = manifest.select(jobs)
+        check_free_space(jobs)
+        prepare_output_dirs(jobs)
+        progress.add_jobs(jobs)
+        if self.pipelined and not (self.resume or self.incremental):
+            return run_pipeline(jobs, self.data_key, self.dest, self.max_workers,
+                                read_size=self.read_size, io_policy=self.io_policy,
+                                progress=progress, cancel=self.cancel_event)
+        tasks = plan_tasks(jobs, self.max_workers, split=not self.resume)
+        return run_tasks(tasks, self.data_key, self.max_workers, on_result, progress=progress,
+                         cancel=self.cancel_event, preallocate=True, read_size=self.read_size,
+                         io_policy=self.io_policy, resume=self.resume)
+
+    def report_progress(self, info):
+        # In tree mode the total grows, so the percentage could go backwards.
+        self._percent = max(self._percent, info.percent)
+        self.progress_update.emit(self._percent)
+        self.progress_info.emit(info)
+
     def cancel(self):
-        self._is_interrupted = True
+        self.cancel_event.set()
 
 class ModernSidebar(QFrame):
     def __init__(self, parent: Optional['MainWindow'] = None):
@@ -103,6 +268,10 @@ class ModernSidebar(QFrame):
         config_section = self.create_config_section()
         content_layout.addWidget(config_section)
 
+        # Performance section
+        performance_section = self.create_performance_section()
+        content_layout.addWidget(performance_section)
+
         # Theme section
         theme_section = self.create_theme_section()
         content_layout.addWidget(theme_section)
@@ -224,10 +393,87 @@ class ModernSidebar(QFrame):
         salt_layout.addLayout(salt_container)
         creds_layout.addLayout(salt_layout)
         
+        # Keep the derived key in the OS keyring (off unless asked for)
+        self.remember_key_checkbox = QCheckBox("Remember key")
+        self.remember_key_checkbox.setToolTip("Save the derived key in the system keyring so later sessions skip the slow key derivation")
+        creds_layout.addWidget(self.remember_key_checkbox)
+        
         layout.addWidget(creds_group)
         
         return section
 
+    def create_performance_section(self):
+        section = QGroupBox("Performance")
+        
+        layout = QVBoxLayout(section)
+        layout.setContentsMargins(10, 15, 10, 10)
+        layout.setSpacing(10)
+        
+        # Number of files decrypted at once
+        workers_layout = QVBoxLayout()
+        workers_layout.setSpacing(6)
+        
+        workers_label = QLabel("Worker Threads:")
+        workers_layout.addWidget(workers_label)
+        
+        cpu_count = os.cpu_count() or 1
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(1, cpu_count * 4)
+        self.workers_spinbox.setValue(min(cpu_count, 4))
+        workers_layout.addWidget(self.workers_spinbox)
+        
+        layout.addLayout(workers_layout)
+        
+        # Ciphertext fetched per read
+        read_size_layout = QVBoxLayout()
+        read_size_layout.setSpacing(6)
+        
+        read_size_label = QLabel("Read Size (MiB):")
+        read_size_layout.addWidget(read_size_label)
+        
+        self.read_size_spinbox = QSpinBox()
+        self.read_size_spinbox.setRange(1, 64)
+        self.read_size_spinbox.setValue(DEFAULT_READ_SIZE // (1024 * 1024))
+        self.read_size_spinbox.setToolTip("Larger reads mean fewer syscalls, which helps on network filesystems")
+        read_size_layout.addWidget(self.read_size_spinbox)
+        
+        layout.addLayout(read_size_layout)
+        
+        # Page-cache policy
+        cache_layout = QVBoxLayout()
+        cache_layout.setSpacing(6)
+        
+        cache_label = QLabel("Cache Policy:")
+        cache_layout.addWidget(cache_label)
+        
+        self.cache_policy_combobox = QComboBox()
+        self.cache_policy_combobox.addItems(list(IO_POLICIES))
+        self.cache_policy_combobox.setToolTip(
+            "sequential: aggressive read-ahead\n"
+            "nocache: also drop processed data from the page cache\n"
+            "direct: as nocache, writing output with O_DIRECT"
+        )
+        cache_layout.addWidget(self.cache_policy_combobox)
+        
+        layout.addLayout(cache_layout)
+        
+        # Overlap reading, decryption and writing
+        self.pipeline_checkbox = QCheckBox("Pipelined I/O")
+        self.pipeline_checkbox.setToolTip("Read, decrypt and write in overlapping stages (best for slow or network storage)")
+        layout.addWidget(self.pipeline_checkbox)
+        
+        # Continue interrupted outputs instead of starting over
+        self.resume_checkbox = QCheckBox("Resume interrupted files")
+        self.resume_checkbox.setToolTip("Keep a journal next to each output so a cancelled or failed run continues where it stopped")
+        layout.addWidget(self.resume_checkbox)
+        
+        # Skip files decrypted by an earlier run
+        self.incremental_checkbox = QCheckBox("Skip unchanged files")
+        self.incremental_checkbox.setToolTip("Remember decrypted files and skip them next time if neither the input nor the output has changed")
+        layout.addWidget(self.incremental_checkbox)
+        
+        return section
+
     def create_theme_section(self):
         section = QGroupBox("Theme")
         
@@ -420,10 +666,10 @@ class ModernMainContent(QFrame):
         
         files_layout.addWidget(files_header)
         
-        # File list widget
-        self.files_listwidget = DragDropListWidget()
-        self.files_listwidget.setMaximumHeight(100)
-        files_layout.addWidget(self.files_listwidget)
+        # File list view; the model is owned by the main window
+        self.files_listview = DragDropListView()
+        self.files_listview.setMaximumHeight(100)
+        files_layout.addWidget(self.files_listview)
         
         parent_layout.addWidget(files_section)
 
@@ -462,6 +708,11 @@ class ModernMainContent(QFrame):
         output_container.addWidget(select_folder_btn)
         
         output_layout.addLayout(output_container)
+        
+        # Recreate dropped folders instead of flattening them
+        self.tree_mode_checkbox = QCheckBox("Keep folder structure")
+        self.tree_mode_checkbox.setToolTip("Decrypt everything inside dropped folders and recreate their subfolders in the output folder")
+        output_layout.addWidget(self.tree_mode_checkbox)
         actions_layout.addWidget(output_section)
         
         # Decrypt button
@@ -597,6 +848,10 @@ class MainWindow(QMainWindow):
         self.crypt_remotes = {}  # Mapping: remote name -> (password, salt)
         self.dest_dir = None
         self.worker = None  # To hold the decryption thread
+        self.config_loader = None
+        self.key_derivers = []
+        self.files_model = FileListModel(self)
+        self.scanners = []  # Directory scanners still expanding dropped paths
         self.current_animation = None  # Keep a reference to the current animation
         self.current_theme_colors = DARK_MODE_COLORS  # Track current theme colors
         
@@ -630,9 +885,10 @@ class MainWindow(QMainWindow):
         self.sidebar_toggle = ModernSidebarToggle(main_container)
         self.sidebar_toggle.set_main_window(self)
         
-        # Connect file list changes to update counter
-        self.main_content.files_listwidget.itemChanged.connect(self.update_files_count)
-        self.main_content.files_listwidget.filesAdded.connect(self.update_files_count)
+        # Dropped paths are expanded in the background; the counter follows the model
+        self.main_content.files_listview.setModel(self.files_model)
+        self.main_content.files_listview.pathsDropped.connect(self.add_input_paths)
+        self.files_model.count_changed.connect(self.update_files_count)
     
     def resizeEvent(self, a0: Optional[QResizeEvent]):
         """Handle window resize events to maintain toggle button positioning"""
@@ -668,13 +924,42 @@ class MainWindow(QMainWindow):
         self.sidebar_animation.start()
         
     def update_files_count(self):
-        count = self.main_content.files_listwidget.count()
-        if count == 0:
-            self.main_content.files_count_label.setText("0 files")
-        elif count == 1:
-            self.main_content.files_count_label.setText("1 file")
+        count = self.files_model.rowCount()
+        if count == 1:
+            text = "1 file"
         else:
-            self.main_content.files_count_label.setText(f"{count} files")
+            text = f"{count} files"
+        if self.scanners:
+            text += " (scanning…)"
+        self.main_content.files_count_label.setText(text)
+
+    def add_input_paths(self, paths):
+        """Add files and folders to the input list; folders are walked on a background thread."""
+        scanner = DirectoryScanner(paths, self.files_model.file_ids)
+        scanner.batch_found.connect(lambda batch, s=scanner: self.add_scanned_files(s, batch))
+        scanner.finished.connect(lambda s=scanner: self.scanner_finished(s))
+        self.scanners.append(scanner)
+        scanner.start()
+        self.update_files_count()
+
+    def add_scanned_files(self, scanner, batch):
+        # Batches still queued from a scanner whose list was cleared are dropped.
+        if scanner in self.scanners:
+            self.files_model.add_batch(batch)
+
+    def scanner_finished(self, scanner):
+        if scanner in self.scanners:
+            self.scanners.remove(scanner)
+        self.update_files_count()
+
+    def clear_input_files(self):
+        for scanner in self.scanners:
+            scanner.cancel()
+        # Scanners stop at the next file, so this doesn't block for long.
+        for scanner in self.scanners:
+            scanner.wait()
+        self.scanners = []
+        self.files_model.clear()
 
     def load_config_action(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select rclone Config File")
@@ -687,13 +972,13 @@ class MainWindow(QMainWindow):
             return
         config_password = pwd.strip()
         try:
-            config = load_rclone_config(file_path, config_password)
+            config, crypt_remotes = load_crypt_remotes(file_path, config_password)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to load config:\n{e}")
             return
         self.rclone_config = config
         self.sidebar.config_status.setText(f"Loaded: {os.path.basename(file_path)}")
-        self.crypt_remotes = get_crypt_remotes(config)
+        self.crypt_remotes = crypt_remotes
         self.sidebar.crypt_combobox.clear()
         if not self.crypt_remotes:
             QMessageBox.warning(self, "Warning", "No crypt remotes found in config.")
@@ -720,6 +1005,9 @@ class MainWindow(QMainWindow):
         self.sidebar.password_lineedit.clear()
         self.sidebar.salt_lineedit.setReadOnly(False)
         self.sidebar.salt_lineedit.clear()
+        self.stop_key_derivers(discard=True)
+        clear_keys()
+        clear_config_cache()
         try:
             import config_storage
             config_storage.clear_config_full()
@@ -728,29 +1016,63 @@ class MainWindow(QMainWindow):
         QMessageBox.information(self, "Info", "Configuration has been removed. Please enter credentials manually.")
 
     def load_last_config(self):
+        """
+        Start loading the last used config in the background. The keyring lookup
+        of its path and password, and reading and decrypting the config itself,
+        would otherwise hold up the first paint.
+        """
+        self.config_loader = ConfigLoader()
+        self.config_loader.loaded.connect(self.apply_last_config)
+        self.config_loader.start()
+
+    def apply_last_config(self, last_config, config, crypt_remotes):
+        if self.rclone_config is not None:
+            # The user loaded a config while this one was still loading.
+            return
         try:
-            import config_storage
-            last_config = config_storage.get_last_config_path()
-            if last_config:
-                stored_password = config_storage.get_config_password(last_config)
-                if stored_password is None:
-                    stored_password = ""
-                try:
-                    config = load_rclone_config(last_config, stored_password)
-                except Exception as e:
-                    print("Auto-loading last config failed:", e)
-                    return
-                self.rclone_config = config
-                self.sidebar.config_status.setText(f"Loaded: {os.path.basename(last_config)}")
-                self.crypt_remotes = get_crypt_remotes(config)
-                self.sidebar.crypt_combobox.clear()
-                if not self.crypt_remotes:
-                    QMessageBox.warning(self, "Warning", "No crypt remotes found in config from last loaded config.")
-                else:
-                    self.sidebar.crypt_combobox.addItems(sorted(self.crypt_remotes.keys()))
+            self.rclone_config = config
+            self.sidebar.config_status.setText(f"Loaded: {os.path.basename(last_config)}")
+            self.crypt_remotes = crypt_remotes
+            self.sidebar.crypt_combobox.clear()
+            if not self.crypt_remotes:
+                QMessageBox.warning(self, "Warning", "No crypt remotes found in config from last loaded config.")
+            else:
+                self.sidebar.crypt_combobox.addItems(sorted(self.crypt_remotes.keys()))
         except Exception as e:
             print("Error during auto-loading config:", e)
 
+    def prederive_keys(self):
+        """
+        Derive keys in the background so Decrypt doesn't wait on scrypt: the
+        selected remote's first, then the others, no more than the key cache
+        holds. Runs again whenever another remote is selected.
+        """
+        selected = self.sidebar.crypt_combobox.currentText()
+        names = sorted(self.crypt_remotes, key=lambda name: (name != selected, name))
+        secrets = [self.crypt_remotes[name] for name in names if self.crypt_remotes[name][0]]
+        if not secrets:
+            return
+        self.stop_key_derivers()
+        deriver = KeyDeriver(secrets[:KEY_CACHE_SIZE])
+        self.key_derivers.append(deriver)
+        deriver.start()
+
+    def stop_key_derivers(self, discard=False):
+        for deriver in self.key_derivers:
+            deriver.cancel(discard)
+        self.key_derivers = [t for t in self.key_derivers if t.isRunning()]
+
+    def closeEvent(self, a0: Optional[QCloseEvent]):
+        # Let the background loaders finish before their QThread objects go away.
+        for scanner in self.scanners:
+            scanner.cancel()
+        for deriver in self.key_derivers:
+            deriver.cancel()
+        for thread in [self.config_loader] + self.key_derivers + self.scanners:
+            if thread is not None:
+                thread.wait()
+        super().closeEvent(a0)
+
     def populate_credentials_from_config(self, remote_name):
         if remote_name in self.crypt_remotes:
             pw, salt = self.crypt_remotes[remote_name]
@@ -758,6 +1080,7 @@ class MainWindow(QMainWindow):
             self.sidebar.salt_lineedit.setText(salt if salt else "")
             self.sidebar.password_lineedit.setReadOnly(True)
             self.sidebar.salt_lineedit.setReadOnly(True)
+            self.prederive_keys()
 
     def select_destination(self):
         directory = QFileDialog.getExistingDirectory(self, "Select Destination Directory")
@@ -768,17 +1091,14 @@ class MainWindow(QMainWindow):
     def select_input_files(self):
         files, _ = QFileDialog.getOpenFileNames(self, "Select Input Files")
         if files:
-            self.main_content.files_listwidget.clear()
-            for file in files:
-                self.main_content.files_listwidget.addItem(file)
-            self.update_files_count()
+            self.clear_input_files()
+            self.add_input_paths(files)
 
     def decrypt_action(self):
-        files = []
-        for i in range(self.main_content.files_listwidget.count()):
-            item = self.main_content.files_listwidget.item(i)
-            if item is not None:
-                files.append(item.text())
+        if self.scanners:
+            QMessageBox.information(self, "Scanning", "Still scanning the dropped folders, please wait.")
+            return
+        files = self.files_model.snapshot()
         password = self.sidebar.password_lineedit.text().strip()
         salt_text = self.sidebar.salt_lineedit.text().strip()
         salt = salt_text if salt_text else None
@@ -787,11 +1107,12 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Error", "Please select files and ensure crypt credentials are provided.")
             return
 
-        try:
-            data_key = make_key(password, salt)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Key derivation failed:\n{e}")
-            return
+        # With "Remember key" the key is kept in the keyring as well, so the
+        # next session doesn't rerun scrypt either. Keys of loaded remotes are
+        # usually cached already; anything else is derived on the worker
+        # thread rather than here.
+        persist = self.sidebar.remember_key_checkbox.isChecked()
+        data_key = lambda: derive_key(password, salt, persist=persist)
 
         dest = self.main_content.dest_dir_lineedit.text().strip() if self.main_content.dest_dir_lineedit.text().strip() else None
 
@@ -801,8 +1122,17 @@ class MainWindow(QMainWindow):
         self.progress_dialog.setValue(0)
         self.progress_dialog.canceled.connect(self.cancel_decryption)
 
-        self.worker = DecryptionWorker(files, data_key, dest)
+        self.worker = DecryptionWorker(files, data_key, dest,
+                                       self.sidebar.workers_spinbox.value(),
+                                       self.sidebar.pipeline_checkbox.isChecked(),
+                                       self.sidebar.read_size_spinbox.value() * 1024 * 1024,
+                                       self.sidebar.cache_policy_combobox.currentText(),
+                                       self.main_content.tree_mode_checkbox.isChecked(),
+                                       self.sidebar.resume_checkbox.isChecked(),
+                                       self.sidebar.incremental_checkbox.isChecked())
         self.worker.progress_update.connect(self.progress_dialog.setValue)
+        self.worker.progress_info.connect(
+            lambda info: self.progress_dialog.setLabelText(f"Decrypting files...\n{format_progress(info)}"))
         self.worker.error_signal.connect(self.handle_worker_error)
         self.worker.finished_signal.connect(self.handle_worker_finished)
         self.worker.start()
@@ -836,7 +1166,7 @@ class MainWindow(QMainWindow):
         colors = self.current_theme_colors
         
         # Update main content icons
-        if hasattr(self.main_content, 'files_listwidget'):
+        if hasattr(self.main_content, 'files_listview'):
             # Update cloud upload icon
             if hasattr(self.main_content, '_upload_icon'):
                 self.main_content._upload_icon.setPixmap(